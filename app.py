@@ -1,4 +1,5 @@
-from dash import Dash, html, dcc, Input, Output, State, callback
+from dash import Dash, html, dcc, Input, Output, State, callback, no_update
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 from helper import *
 import plotly.graph_objects as go
@@ -6,6 +7,10 @@ from plotly.subplots import make_subplots
 import numpy as np
 from dotenv import load_dotenv
 import os
+import json
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from google import genai
 
 load_dotenv()
@@ -25,6 +30,22 @@ app.title = "Personalized Climate Score"
 server = app.server
 # Create default Score object for initial values
 default_score = Score()
+# Serialized figures of recent requests, keyed by figure_cache_key
+figure_cache = LRUCache(int(os.getenv('FIGURE_CACHE_SIZE', '32')))
+# Scored city results of recent requests, keyed by request id; each chart callback renders from here
+results_store = LRUCache(int(os.getenv('RESULTS_STORE_SIZE', '16')))
+MODELS = ["EC_Earth3P_HR", "MRI_AGCM3_2_S", "NICAM16_8S"]
+# Cold requests are computed as background jobs so the web workers stay free
+background_jobs = BackgroundJobs(int(os.getenv('JOB_WORKERS', '2')))
+
+# Gemini: one shared client, a bounded pool for concurrent calls, a time budget (seconds)
+# per panel and a response cache keyed by prompt_cache_key
+GEMINI_MODEL = "gemini-2.0-flash"
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '30'))
+gemini_executor = ThreadPoolExecutor(max_workers=int(os.getenv('GEMINI_WORKERS', '4')))
+gemini_cache = LRUCache(int(os.getenv('GEMINI_CACHE_SIZE', '256')), ttl=float(os.getenv('GEMINI_CACHE_TTL', '86400')))
+_gemini_client = None
+_gemini_client_lock = threading.Lock()
 
 # App layout
 app.layout = html.Div([
@@ -633,6 +654,13 @@ app.layout = html.Div([
         ),
     ], style={'margin': '30px', 'padding': '20px'}),
     
+    # The current request (inputs and request id), its background job and the id of its results in results_store
+    dcc.Store(id='request-store'),
+    dcc.Store(id='job-store'),
+    dcc.Store(id='results-store'),
+    # Polls the running job for progress; enabled only while a job runs
+    dcc.Interval(id='job-poll', interval=500, disabled=True),
+
     # Footer
     html.Div([
         html.Span("Find a bug? Report it ", style={'color': '#808080'}),
@@ -641,15 +669,7 @@ app.layout = html.Div([
 ], style={'padding': '20px'})
 
 @callback(
-    [Output('score-distribution', 'figure'),
-     Output('score-average', 'figure'),
-     Output('monthly-stacked-scores', 'figure'),
-     Output('reason-distribution', 'figure'),
-     Output('pm25-chart', 'figure'),     
-     Output('city-map', 'figure'),
-     Output('calculation-status', 'children'),
-     Output('gemini-suggestions', 'children'),
-     Output('location-gemini-comparison', 'children')],
+    Output('request-store', 'data'),
     [Input('calculate-btn', 'n_clicks')],
     [State('city1', 'value'), State('state1', 'value'), State('include1', 'value'),
      State('city2', 'value'), State('state2', 'value'), State('include2', 'value'),
@@ -677,12 +697,16 @@ app.layout = html.Div([
      State('tornado-risk', 'value'),
      State('additional-preferences', 'value')]
 )
-def update_charts(n_clicks, city1, state1, include1, city2, state2, include2, city3, state3, include3,
-                  ideal_temp_range, time_window_range, sunny_day_coef, too_cold_still_temp, too_cold_still_coef,
-                  too_cold_windy_temp, too_cold_windy_coef, humid_day_max, humid_day_coef,
-                  light_rain_coef, heavy_rain_coef, snow_coef, overcast_coef, dry_heat_min, dry_heat_coef,
-                  flooding_risk, wildfire_risk, smoke_risk, earthquake_risk, hurricane_risk, tornado_risk,
-                  additional_preferences):
+def update_request(n_clicks, city1, state1, include1, city2, state2, include2, city3, state3, include3,
+                   ideal_temp_range, time_window_range, sunny_day_coef, too_cold_still_temp, too_cold_still_coef,
+                   too_cold_windy_temp, too_cold_windy_coef, humid_day_max, humid_day_coef,
+                   light_rain_coef, heavy_rain_coef, snow_coef, overcast_coef, dry_heat_min, dry_heat_coef,
+                   flooding_risk, wildfire_risk, smoke_risk, earthquake_risk, hurricane_risk, tornado_risk,
+                   additional_preferences):
+    """
+    Turn the inputs into a request with a new request id. The compute step, the
+    Gemini panels and (through the results store) every chart are driven by it.
+    """
     
     # If first load, use default values for all inputs
     
@@ -746,7 +770,6 @@ def update_charts(n_clicks, city1, state1, include1, city2, state2, include2, ci
         max_time = f"{max_hour:02d}:00:00"
         climate_score.set_time_window(min_time, max_time)
 
-    # --- Gemini API integration ---
     disaster_preferences = {
         'flooding': flooding_risk,
         'wildfire (direct impacts only)': wildfire_risk,
@@ -755,498 +778,291 @@ def update_charts(n_clicks, city1, state1, include1, city2, state2, include2, ci
         'hurricanes': hurricane_risk,
         'tornados': tornado_risk
     }
-    prompt = build_gemini_prompt(climate_score, additional_preferences, disaster_preferences)
-    try:
-        client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-        )
-        # Format Gemini response as Markdown for nice display
-        gemini_text = dcc.Markdown(response.text, style={'background': '#f9f9ff', 'padding': '10px', 'borderRadius': '5px'})
-    except Exception as e:
-        gemini_text = html.Div(f"Could not get suggestions from Gemini: {e}", style={'color': 'red'})
-
-    # --- Location-specific Gemini comparison ---
-    location_gemini_div = html.Div()
-    if (additional_preferences or any(v != 'ok' for v in disaster_preferences.values())) and city_states:
-        location_gemini_responses = []
-        for city, state in city_states:
-            try:
-                loc_prompt = build_gemini_location_prompt(city, state, additional_preferences, disaster_preferences)
-                client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
-                loc_response = client.models.generate_content(
-                    model="gemini-2.0-flash",
-                    contents=loc_prompt,
-                )
-                location_gemini_responses.append(
-                    html.Div([
-                        html.H4(f"{city}, {state}"),
-                        dcc.Markdown(loc_response.text, style={'background': '#f9f9ff', 'padding': '10px', 'borderRadius': '5px'})
-                    ], style={'flex': '1', 'margin': '10px'})
-                )
-            except Exception as e:
-                location_gemini_responses.append(
-                    html.Div([
-                        html.H4(f"{city}, {state}"),
-                        html.Div(f"Could not get Gemini response: {e}", style={'color': 'red'})
-                    ], style={'flex': '1', 'margin': '10px'})
-                )
-        location_gemini_div = html.Div(
-            location_gemini_responses,
-            style={'display': 'flex', 'flexDirection': 'row', 'justifyContent': 'space-between'}
-        )
+    return {
+        'request_id': uuid.uuid4().hex,
+        'city_states': city_states,
+        'score_params': climate_score.get_all_parameters(),
+        'disaster_preferences': disaster_preferences,
+        'additional_preferences': additional_preferences,
+    }
 
-    # For the map, collect lat/lon and city labels
-    lats, lons, labels = [], [], []
-    score_subplots = []
-    average_subplots = []
-    pm25_subplots = []
-    reason_subplots = []
-    monthly_stacked_subplots = []
+
+def request_city_states(request):
+    """(city, state) tuples of a request (the store hands them back as lists)."""
+    return [tuple(city_state) for city_state in request['city_states']]
+
+
+def request_score(request):
+    """Rebuild the Score object of a request."""
+    climate_score = Score()
+    climate_score.set_all_parameters(request['score_params'])
+    return climate_score
+
+
+@callback(
+    Output('job-store', 'data'),
+    Input('request-store', 'data'),
+    State('job-store', 'data')
+)
+def compute_results(request, previous_job):
+    """
+    Start computing a request. A repeated request is answered from the figure cache
+    right away; anything else is queued as a background job. A job still running for
+    this page's previous request is cancelled.
+    """
+    if request is None:
+        raise PreventUpdate
+    if previous_job and previous_job['job_id']:
+        background_jobs.cancel(previous_job['job_id'])
+    city_states = request_city_states(request)
+    climate_score = request_score(request)
+    job = {
+        'request_id': request['request_id'],
+        'job_id': None,
+        'cities': [f"{city}, {state}" for city, state in city_states],
+    }
+
+    # Identical requests reuse the serialized figures and skip data processing entirely
+    figure_key = figure_cache_key(city_states, climate_score)
+    cached_figures = figure_cache.get(figure_key)
+    if cached_figures is not None and len(cached_figures['figures']) == len(CHART_IDS):
+        results_store.put(request['request_id'], {
+            'city_states': city_states,
+            'city_results': None,
+            'figures': cached_figures['figures'],
+            'status': cached_figures['status'],
+        })
+    else:
+        job['job_id'] = background_jobs.submit(run_request_job, request['request_id'], city_states, climate_score, figure_key)
+    return job
+
+
+def run_request_job(job, request_id, city_states, climate_score, figure_key):
+    """Background job: fetch and score the cities of a request and keep the results under its request id."""
+    # Fetch and score all cities in parallel; results come back in input order
+    city_results = fetch_and_score_cities(city_states, climate_score, models=MODELS, progress=job.report)
+    # Cities stop at their next stage once the job is cancelled; drop the partial results
+    if job.cancelled:
+        raise JobCancelled(job.job_id)
     status_msgs = []
-    subplot_titles = []
-    show_legend = False
-
-    j = 1
-    for city, state in city_states:
-        show_legend = j == len(city_states)
-        j += 1
-        try:
-            lat, lon, timezone, pop = get_city_info(city, state)
-            lats.append(lat)
-            lons.append(lon)
-            labels.append(f"{city}, {state}")
-            # Use cache-aware versions of the data retrieval and scoring functions
-            historical_daily_df, pm25_df, _, _ = get_historical_and_aqi_data(lat, lon, timezone, city, state)  
-            # --- Combined forecasted data (all models) ---
-            combined_forecasted_df, _ = get_combined_forecasted_data(
-                lat, lon, timezone, city, state,
-                models=["EC_Earth3P_HR", "MRI_AGCM3_2_S", "NICAM16_8S"]
-            )
-            scored_historical_df, reasons_historical = process_historical_for_plotting(
-                historical_daily_df, climate_score, city=city, state=state
-            )
-            scored_combined_forecasted_df, reasons_combined_forecasted = process_combined_forecasted_for_plotting(
-                combined_forecasted_df, climate_score,
-                models=["EC_Earth3P_HR", "MRI_AGCM3_2_S", "NICAM16_8S"],
-                city=city, state=state
-            )
+    for (city, state), city_result in zip(city_states, city_results):
+        if isinstance(city_result, Exception):
+            status_msgs.append(f"{city}, {state}: Error - {str(city_result)}")
+        else:
+            status_msgs.append(f"{city}, {state}: Data retrieved successfully")
+    # The chart callbacks fill in the figures as they render them
+    figures = {}
+    # Don't cache failures, which may be transient
+    if not any(isinstance(city_result, Exception) for city_result in city_results):
+        figure_cache.put(figure_key, {'figures': figures, 'status': status_msgs})
 
-            # Safely cast the date columns to datetime for both dataframes
-            if 'date' in scored_historical_df.columns:
-                scored_historical_df['date'] = pd.to_datetime(scored_historical_df['date'], errors='coerce')
-            if 'date' in scored_combined_forecasted_df.columns:
-                scored_combined_forecasted_df['date'] = pd.to_datetime(scored_combined_forecasted_df['date'], errors='coerce')
-            
-
-            min_forecasted_date = None
-            if not scored_combined_forecasted_df.empty:
-                min_forecasted_date = scored_combined_forecasted_df["date"].min()
-            if min_forecasted_date is not None and hasattr(min_forecasted_date, 'year'):
-                min_forecasted_year = min_forecasted_date.year
-            else:
-                min_forecasted_year = scored_historical_df['year'].max()
+    results_store.put(request_id, {
+        'city_states': city_states,
+        'city_results': city_results,
+        'figures': figures,
+        'status': status_msgs,
+    })
 
-            max_historical_date = None
-            if not scored_historical_df.empty:
-                max_historical_date = scored_historical_df["date"].max()
-            if max_historical_date is not None and hasattr(max_historical_date, 'year'):
-                max_historical_year = max_historical_date.year
-            else:
-                max_historical_year = scored_historical_df['year'].max()
 
-            # If the last year of historical == first year of forecasted, Get the number of distinct days in the shared year in both historical and forecasted dataframes
-            if max_historical_year == min_forecasted_year:
-                shared_year = max_historical_year  # This is the year present in both
-                num_days_shared_historical = scored_historical_df[scored_historical_df['year'] == shared_year]['date'].nunique()
-                num_days_shared_forecasted = scored_combined_forecasted_df[scored_combined_forecasted_df['year'] == shared_year]['date'].nunique()
-                
+@callback(
+    [Output('results-store', 'data'),
+     Output('calculation-status', 'children'),
+     Output('job-poll', 'disabled')],
+    [Input('job-store', 'data'),
+     Input('job-poll', 'n_intervals')]
+)
+def poll_job(job_data, n_intervals):
+    """Show the stage each city has reached, and publish the results once the job is done."""
+    if job_data is None:
+        raise PreventUpdate
+    job = background_jobs.get(job_data['job_id']) if job_data['job_id'] else None
 
-            # --- Score Distribution ---
-            score_percents_historical = {}
-            score_percents_combined_forecasted = {}
-            all_dates = pd.concat([scored_historical_df[['year', 'date']], scored_combined_forecasted_df[['year', 'date']]])
-            dates_per_year = all_dates.drop_duplicates().groupby('year')['date'].nunique()
-            score_cols = [col for col in scored_combined_forecasted_df.columns if col.startswith('score_')]
-            score_percents_by_model = []
-            for col in score_cols:
-                model_percents = {}
-                for score_val in [0, 25, 50, 75, 100]:
-                    score_percent = scored_combined_forecasted_df[scored_combined_forecasted_df[col] == score_val].groupby('year').size() / dates_per_year #scored_combined_forecasted_df.groupby('year').size()
-                    model_percents[score_val] = 100 * score_percent.fillna(0)
-                score_percents_by_model.append(model_percents)
-
-            for score_val in [0, 25, 50, 75, 100]:
-                # Calculate the denominator: number of distinct dates per year across both historical and combined forecasted dataframes
-                score_percent = scored_historical_df[scored_historical_df['score'] == score_val].groupby('year').size() / dates_per_year
-                score_percents_historical[score_val] = 100*score_percent.fillna(0)
-                dfs = [model[score_val] for model in score_percents_by_model]
-                if dfs:
-                    combined = pd.concat(dfs, axis=1).mean(axis=1)
-                else:
-                    combined = pd.Series(dtype=float)
-                score_percents_combined_forecasted[score_val] = combined
-            
-            score_traces = []
-            for score_val, color, score_name in zip([0, 25, 50, 75, 100], ['#ba1535', '#ba6715', '#b7ba15', '#43ba15', '#158cba'], ['Hate', 'Dislike', 'Neutral', 'Like', 'Love']): 
-                score_traces.append(
-                    go.Bar(
-                        x=score_percents_historical[score_val].index,
-                        y=score_percents_historical[score_val].values,
-                        name=score_name,
-                        marker_color=color,
-                        showlegend=show_legend,
-                        legendgroup = score_name
-                    )
-                )
-                score_traces.append(
-                    go.Bar(
-                        x=score_percents_combined_forecasted[score_val].index,
-                        y=score_percents_combined_forecasted[score_val].values,
-                        name=score_name,
-                        marker_color=color,
-                        opacity=0.7,
-                        showlegend=False,
-                        legendgroup = score_name
-                    )
-                )
-            score_subplots.append((score_traces, min_forecasted_year, f"{city}, {state}"))
-            # --- Score Average ---
-            avg_score_historical = scored_historical_df.groupby('year')['score'].mean()
-            # Take the average score for each of the score columns, then average across those averages by year
-            score_cols = [col for col in scored_combined_forecasted_df.columns if col.startswith('score_')]
-            avg_scores_per_col = scored_combined_forecasted_df.groupby('year')[score_cols].mean()
-            avg_score_forecasted = avg_scores_per_col.mean(axis=1)
-            min_score_forecasted = avg_scores_per_col.min(axis=1)
-            max_score_forecasted = avg_scores_per_col.max(axis=1)
-
-            # Find the shared year between historical and forecasted
-            if shared_year:
-                total_days = num_days_shared_historical + num_days_shared_forecasted
-                # Weighted average for mean
-                hist_avg = avg_score_historical.loc[shared_year]
-                fore_avg = avg_score_forecasted.loc[shared_year]
-                weighted_avg = (
-                    hist_avg * num_days_shared_historical + fore_avg * num_days_shared_forecasted
-                ) / total_days
-                avg_score_forecasted.loc[shared_year] = weighted_avg
-
-                fore_min = min_score_forecasted.loc[shared_year]
-                fore_max = max_score_forecasted.loc[shared_year]
-                weighted_min = (
-                    hist_avg * (num_days_shared_historical / total_days)
-                    + fore_min * (num_days_shared_forecasted / total_days)
-                )
-                weighted_max = (
-                    hist_avg * (num_days_shared_historical / total_days)
-                    + fore_max * (num_days_shared_forecasted / total_days)
-                )
-                min_score_forecasted.loc[shared_year] = weighted_min
-                max_score_forecasted.loc[shared_year] = weighted_max
-
-                # Set the avg score historical for the shared year to the forecasted value
-                avg_score_historical.loc[shared_year] = avg_score_forecasted.loc[shared_year]
-
-            average_traces = [
-                go.Scatter(
-                    x=avg_score_historical.index, 
-                    y=avg_score_historical.values, 
-                    mode='lines', 
-                    name='Historical', 
-                    line=dict(color='#158cba', width=2),
-                    showlegend=show_legend, 
-                    legendgroup = 'avg_graphs__h'
-                ),
-                go.Scatter(
-                    x=avg_score_forecasted.index, 
-                    y=avg_score_forecasted.values, 
-                    mode='lines', 
-                    name='Forecasted', 
-                    line=dict(color='#ba1535', width=2), 
-                    showlegend=show_legend,
-                    legendgroup = 'avg_graphs__f'
-                ),
-                go.Scatter(
-                    name='Upper Bound',
-                    x=max_score_forecasted.index,
-                    y=max_score_forecasted.values,
-                    mode='lines',
-                    marker=dict(color="#444"),
-                    line=dict(width=0),
-                    showlegend=False, 
-                    legendgroup = 'avg_graphs__f'
-                ),
-                go.Scatter(
-                    name='Lower Bound',
-                    x=min_score_forecasted.index,
-                    y=min_score_forecasted.values,
-                    marker=dict(color="#444"),
-                    line=dict(width=0),
-                    mode='lines',
-                    fillcolor='rgba(68, 68, 68, 0.3)',
-                    fill='tonexty',
-                    showlegend=False, 
-                    legendgroup = 'avg_graphs__f'
-                )
-            ]
-            average_subplots.append((average_traces, f"{city}, {state}"))
-            
-            # --- Monthly Stacked ---
-            scored_historical_df['month'] = scored_historical_df['date'].dt.month
-            monthly_avg_hist = scored_historical_df.groupby(['year', 'month'])['score'].mean().reset_index()
-            years_hist = sorted(monthly_avg_hist['year'].unique())
-            n_hist = len(years_hist)
-            hist_traces = []
-            for i, year in enumerate(years_hist):
-                year_data = monthly_avg_hist[monthly_avg_hist['year'] == year]
-                fade = 0.2 + 0.8 * (i + 1) / n_hist
-                hist_traces.append(
-                    go.Scatter(x=year_data['month'], y=year_data['score'], mode='lines', name=f'{year}', line=dict(color=f'rgba(21, 140, 186,{fade})', width=2), showlegend=show_legend, legendgroup = f'{year}')
-                )
-            
-            scored_combined_forecasted_df['month'] = scored_combined_forecasted_df['date'].dt.month
-            score_cols = [col for col in scored_combined_forecasted_df.columns if col.startswith('score_')]
-            avg_scores_per_col = scored_combined_forecasted_df.groupby(['year', 'month'])[score_cols].mean()
-            monthly_avg_fore = avg_scores_per_col.mean(axis=1).reset_index(name='score')
-            years_fore = sorted(monthly_avg_fore['year'].unique())
-            n_fore = len(years_fore)
-            fore_traces = []
-            for i, year in enumerate(years_fore):
-                year_data = monthly_avg_fore[monthly_avg_fore['year'] == year]
-                fade = 0.2 + 0.8 * (n_fore - i) / n_fore
-                fore_traces.append(
-                    go.Scatter(x=year_data['month'], y=year_data['score'], mode='lines', name=f'{year}', line=dict(color=f'rgba(186, 21, 53,{fade})', width=2), showlegend=show_legend, legendgroup = f'{year}')
-                )
-            monthly_stacked_subplots.append((hist_traces + fore_traces, f"{city}, {state}"))
-            
-            # --- Reason Distribution ---
-            all_reasons = list(set(reasons_historical).union(set(reasons_combined_forecasted)))
-            reason_counts_historical = {reason: scored_historical_df[scored_historical_df['reason'] == reason].groupby('year').size() for reason in all_reasons}
-            
-            # For combined forecasted df: get reason count for each reason_* column by year, then average per year for each reason
-            reason_cols = [col for col in scored_combined_forecasted_df.columns if col.startswith('reason_')]
-            years = scored_combined_forecasted_df['year'].unique()
-            reason_counts_forecasted = {}
-            reason_mins_forecasted = {}
-            reason_maxs_forecasted = {}
-            for reason in all_reasons:
-                # For each year, count how many times this reason appears in any reason_* column
-                yearly_means = []
-                yearly_mins = []
-                yearly_maxs = []
-                for year in sorted(years):
-                    df_year = scored_combined_forecasted_df[scored_combined_forecasted_df['year'] == year]
-                    # Count occurrences of this reason in all reason_* columns for this year
-                    mean_cnt = sum((df_year[col] == reason).sum() for col in reason_cols)  / len(reason_cols)
-                    min_cnt = min((df_year[col] == reason).sum() for col in reason_cols) 
-                    max_cnt = max((df_year[col] == reason).sum() for col in reason_cols) 
-                    # Normalize by number of models (columns) to get average per year
-                    yearly_means.append((year, mean_cnt))
-                    yearly_mins.append((year, min_cnt))
-                    yearly_maxs.append((year, max_cnt))
-                # Convert to pandas Series for compatibility with plotting code
-                reason_counts_forecasted[reason] = pd.Series(
-                    [mean_cnt for year, mean_cnt in yearly_means],
-                    index=[year for year, mean_cnt in yearly_means],
-                    dtype=float
-                )
-                reason_mins_forecasted[reason] = pd.Series(
-                    [min_cnt for year, min_cnt in yearly_mins],
-                    index=[year for year, min_cnt in yearly_mins],
-                    dtype=float
-                )
-                reason_maxs_forecasted[reason] = pd.Series(
-                    [max_cnt for year, max_cnt in yearly_maxs],
-                    index=[year for year, max_cnt in yearly_maxs],
-                    dtype=float
-                )
+    if job_data['job_id'] is None or (job is not None and job.state == 'done'):
+        entry = results_store.get(job_data['request_id'])
+        if entry is not None:
+            # Instead of joining with '<br>', use html.Div for each message
+            status_children = [html.Div(msg) for msg in entry['status']]
+            return {'request_id': job_data['request_id']}, status_children, True
+    if job is None or job.state == 'done':
+        return no_update, html.Div("Calculation results are no longer available; please calculate again."), True
+    if job.state == 'cancelled':
+        return no_update, no_update, True
+    if job.state == 'failed':
+        return no_update, html.Div(f"Error - {str(job.error)}"), True
 
-            # Find shared years between historical and forecasted
-            if shared_year:
-                for reason in all_reasons:
-                    hist_series = reason_counts_historical.get(reason)
-                    if hist_series is not None:
-                        # Add to forecasted series if it exists, else create a new one
-                        for forecast_dict in [
-                            reason_counts_forecasted,
-                            reason_mins_forecasted,
-                            reason_maxs_forecasted
-                        ]:
-                            forecast_series = forecast_dict.get(reason)
-                            if forecast_series is not None:
-                                # Add historical to forecasted, aligning on index
-                                combined_series = forecast_series.add(hist_series.astype(float), fill_value=0)
-                            else:
-                                # If no forecast data, just use the historical
-                                combined_series = hist_series.astype(float).copy()
-                            forecast_dict[reason] = combined_series
-                    if reason in reason_counts_forecasted:
-                        updated_forecast_series = reason_counts_forecasted[reason]
-                        if reason in reason_counts_historical:
-                            historical_series = reason_counts_historical[reason]
-                            # Align and update matching year values only
-                            historical_series.update(updated_forecast_series.loc[historical_series.index].astype(float))
-                        else:
-                            # If the reason wasn't in historical, create a new one with only the years from forecasted
-                            reason_counts_historical[reason] = updated_forecast_series.copy()
+    status_msgs = []
+    for i, label in enumerate(job_data['cities']):
+        stage = job.progress.get(i)
+        if stage is None:
+            status_msgs.append(f"{label}: waiting")
+        else:
+            status_msgs.append(f"{label}: {stage} ({PIPELINE_STAGES.index(stage) + 1}/{len(PIPELINE_STAGES)})")
+    return no_update, [html.Div(msg) for msg in status_msgs], False
 
-                
-            # Define theme colors for consistent coloring
-            reason_to_color = {
-                "neutral": "#158cba",
-                "too hot, humid": "#3f15ba",
-                "too hot, dry": "#7a15ba",
-                "too cold, windy": "#ba15a1",
-                "too cold, still": "#ba1535",
-                "ideal sunny": "#ba6715",
-                "ideal overcast": "#b7ba15",
-                "light rain": "#43ba15",
-                "heavy rain": "#15ba67",
-                "snow": "#15b7ba"
-            }            
-            reason_traces = []
-            for reason, color in reason_to_color.items():
-                added_trace = False  # Track whether we’ve added at least one visible trace
-
-                # Historical trace (solid line)
-                hist_data = reason_counts_historical.get(reason)
-                if hist_data is not None and not hist_data.empty:
-                    reason_traces.append(
-                        go.Scatter(
-                            x=hist_data.index,
-                            y=hist_data.values,
-                            mode='lines',
-                            name=reason,
-                            line=dict(dash='solid', color=color),
-                            marker=dict(color=color),
-                            showlegend=show_legend, 
-                            legendgroup = reason
-                        )
-                    )
-                    added_trace = True
-
-                # Forecasted trace (dotted line)
-                forecast_data = reason_counts_forecasted.get(reason)
-                forecast_mins = reason_mins_forecasted.get(reason)
-                forecast_maxs = reason_maxs_forecasted.get(reason)
-                if forecast_data is not None and forecast_mins is not None and forecast_maxs is not None and not forecast_data.empty:
-                    reason_traces.append(
-                        go.Scatter(
-                            x=forecast_mins.index,
-                            y=forecast_mins.values,
-                            mode='lines',
-                            name='Lower Bound '+reason,
-                            line=dict(width=0),
-                            marker=dict(color=color),
-                            showlegend=False,  # Only show legend if no historical
-                            legendgroup = reason
-                        )
-                    )
-                    reason_traces.append(
-                        go.Scatter(
-                            name='Upper Bound '+reason,
-                            x=forecast_maxs.index,
-                            y=forecast_maxs.values,
-                            marker=dict(color=color),
-                            line=dict(width=0),
-                            mode='lines',
-                            fillcolor=hex_to_rgba(color, 0.3),
-                            fill='tonexty',
-                            showlegend=False, 
-                            legendgroup = reason
-                        )
-                    )
-                    reason_traces.append(
-                        go.Scatter(
-                            x=forecast_data.index,
-                            y=forecast_data.values,
-                            mode='lines',
-                            name=reason,
-                            line=dict(dash='solid', color=color),
-                            marker=dict(color=color),
-                            showlegend=not added_trace and show_legend,  # Only show legend if no historical
-                            legendgroup = reason
-                        )
-                    )
-                    added_trace = True
-
-                # If no data at all, add a dummy invisible trace to lock in the color
-                else:
-                    reason_traces.append(
-                        go.Scatter(
-                            x=[None],
-                            y=[None],
-                            mode='lines',
-                            name=reason,
-                            line=dict(dash='solid', color=color),
-                            marker=dict(color=color),
-                            showlegend=show_legend,
-                            legendgroup = reason
-                        )
-                    )
-            reason_subplots.append((reason_traces, f"{city}, {state}"))
-            
-            # --- PM2.5 ---
-            pm25_df['year'] = pd.to_datetime(pm25_df['date']).dt.year
-            pm25_categories = {
-                'Healthy': (0, 12),
-                'Moderate': (12, 35.5),
-                'Unhealthy for Sensitive': (35.5, 55.5),
-                'Unhealthy': (55.5, 150.5),
-                'Hazardous': (150.5, float('inf'))
-            }
-            pm25_data = {}
-            for category, (min_val, max_val) in pm25_categories.items():
-                if max_val == float('inf'):
-                    mask = (pm25_df['pm2_5__micrograms_per_cubic_metre'] >= min_val) & (pm25_df['pm2_5__micrograms_per_cubic_metre'].notna())
-                else:
-                    mask = (pm25_df['pm2_5__micrograms_per_cubic_metre'] >= min_val) & (pm25_df['pm2_5__micrograms_per_cubic_metre'] < max_val) & (pm25_df['pm2_5__micrograms_per_cubic_metre'].notna())
-                yearly_counts = pm25_df[mask].groupby('year').size()
-                total_hours_per_year = pm25_df[pm25_df['pm2_5__micrograms_per_cubic_metre'].notna()].groupby('year').size()
-                pm25_data[category] = (yearly_counts / total_hours_per_year * 100)
-
-            pm25_traces = []
-            for category, color in zip(['Healthy', 'Moderate', 'Unhealthy for Sensitive', 'Unhealthy', 'Hazardous'], ['green', 'yellow', 'orange', 'red', 'purple']):
-                pm25_traces.append(
-                    go.Bar(
-                        x=pm25_data[category].index,
-                        y=pm25_data[category].values,
-                        name=category,
-                        marker_color=color,
-                        showlegend=show_legend,
-                        legendgroup = category
-                    )
+
+def get_gemini_client():
+    """
+    Get the shared Gemini client. Requests through it time out after GEMINI_TIMEOUT seconds.
+    
+    Returns:
+        genai.Client
+    """
+    global _gemini_client
+    if _gemini_client is None:
+        with _gemini_client_lock:
+            if _gemini_client is None:
+                _gemini_client = genai.Client(
+                    api_key=os.getenv('GEMINI_API_KEY'),
+                    http_options={'timeout': int(GEMINI_TIMEOUT * 1000)}
                 )
-            pm25_subplots.append((pm25_traces, f"{city}, {state}"))
-            
-            
-            status_msgs.append(f"{city}, {state}: Data retrieved successfully")
-        except Exception as e:
-            status_msgs.append(f"{city}, {state}: Error - {str(e)}")
-            # Add empty traces for this city
-            score_subplots.append(([], 0, f"{city}, {state}"))
-            average_subplots.append(([], f"{city}, {state}"))
-            pm25_subplots.append(([], f"{city}, {state}"))
-            reason_subplots.append(([], f"{city}, {state}"))
-            monthly_stacked_subplots.append(([], f"{city}, {state}"))
-
-    # Build subplots for each plot type
-    n_cities = len(city_states)
+    return _gemini_client
+
+
+def generate_gemini_text(prompt):
+    """Gemini's answer to prompt, from gemini_cache if the same prompt was answered recently."""
+    key = prompt_cache_key(prompt)
+    text = gemini_cache.get(key)
+    if text is None:
+        response = get_gemini_client().models.generate_content(
+            model=GEMINI_MODEL,
+            contents=prompt,
+        )
+        text = response.text
+        gemini_cache.put(key, text)
+    return text
 
-    # Score Distribution
+
+def generate_gemini_texts(prompts, timeout=None):
+    """
+    Answer several prompts concurrently on the Gemini pool.
+    
+    Args:
+        prompts: list of prompt strings
+        timeout: seconds to wait for all answers (default GEMINI_TIMEOUT)
+    
+    Returns:
+        list with the response text for each prompt, in order; a prompt that failed or was not
+        answered in time has the Exception instead. Late answers still land in the cache.
+    """
+    timeout = GEMINI_TIMEOUT if timeout is None else timeout
+    futures = [gemini_executor.submit(generate_gemini_text, prompt) for prompt in prompts]
+    done, _ = wait(futures, timeout=timeout)
+    results = []
+    for future in futures:
+        if future not in done:
+            results.append(TimeoutError(f"no response within {timeout:g} seconds"))
+        elif future.exception() is not None:
+            results.append(future.exception())
+        else:
+            results.append(future.result())
+    return results
+
+
+@callback(
+    Output('gemini-suggestions', 'children'),
+    Input('request-store', 'data')
+)
+def update_gemini_suggestions(request):
+    """Location suggestions from Gemini; runs alongside the compute step so it never holds back the charts."""
+    if request is None:
+        raise PreventUpdate
+    prompt = build_gemini_prompt(request_score(request), request['additional_preferences'], request['disaster_preferences'])
+    text, = generate_gemini_texts([prompt])
+    if isinstance(text, Exception):
+        return html.Div(f"Could not get suggestions from Gemini: {text}", style={'color': 'red'})
+    # Format Gemini response as Markdown for nice display
+    return dcc.Markdown(text, style={'background': '#f9f9ff', 'padding': '10px', 'borderRadius': '5px'})
+
+
+@callback(
+    Output('location-gemini-comparison', 'children'),
+    Input('request-store', 'data')
+)
+def update_location_gemini(request):
+    """Location-specific Gemini comparison, shown when there are disaster or additional preferences."""
+    if request is None:
+        raise PreventUpdate
+    city_states = request_city_states(request)
+    additional_preferences = request['additional_preferences']
+    disaster_preferences = request['disaster_preferences']
+    if not ((additional_preferences or any(v != 'ok' for v in disaster_preferences.values())) and city_states):
+        return html.Div()
+
+    # One prompt per city, all sent at once
+    loc_prompts = [
+        build_gemini_location_prompt(city, state, additional_preferences, disaster_preferences)
+        for city, state in city_states
+    ]
+    location_gemini_responses = []
+    for (city, state), text in zip(city_states, generate_gemini_texts(loc_prompts)):
+        if isinstance(text, Exception):
+            location_gemini_responses.append(
+                html.Div([
+                    html.H4(f"{city}, {state}"),
+                    html.Div(f"Could not get Gemini response: {text}", style={'color': 'red'})
+                ], style={'flex': '1', 'margin': '10px'})
+            )
+        else:
+            location_gemini_responses.append(
+                html.Div([
+                    html.H4(f"{city}, {state}"),
+                    dcc.Markdown(text, style={'background': '#f9f9ff', 'padding': '10px', 'borderRadius': '5px'})
+                ], style={'flex': '1', 'margin': '10px'})
+            )
+    return html.Div(
+        location_gemini_responses,
+        style={'display': 'flex', 'flexDirection': 'row', 'justifyContent': 'space-between'}
+    )
+
+
+def scored_cities(city_results):
+    """
+    Yield (column, city_result, show_legend) for every city that was scored.
+    Cities that failed keep an empty subplot; the legend is shown once, on the last column.
+    """
+    for i, city_result in enumerate(city_results):
+        if not isinstance(city_result, Exception):
+            yield i + 1, city_result, i + 1 == len(city_results)
+
+
+def build_score_distribution_figure(city_states, city_results):
+    """Percentage of days with each score per year, historical and forecasted."""
     # Ensure subplot_titles are strings, not tuples
     subplot_titles = [f"{city}, {state}" for city, state in city_states]
+    n_cities = len(city_states)
 
     score_fig = make_subplots(rows=1, cols=n_cities, subplot_titles=subplot_titles)
-    for i, (traces, min_forecasted_year, label) in enumerate(score_subplots):
-        for trace in traces:
-            score_fig.add_trace(trace, row=1, col=i+1)
+    for col, city_result, show_legend in scored_cities(city_results):
+        summary = city_result['summary']
+        for k, (score_val, color, score_name) in enumerate(zip(SCORE_VALUES, ['#ba1535', '#ba6715', '#b7ba15', '#43ba15', '#158cba'], ['Hate', 'Dislike', 'Neutral', 'Like', 'Love'])): 
+            score_fig.add_trace(
+                go.Bar(
+                    x=summary['years'],
+                    y=summary['historical_shares'][:, k],
+                    name=score_name,
+                    marker_color=color,
+                    showlegend=show_legend,
+                    legendgroup = score_name
+                ),
+                row=1, col=col
+            )
+            score_fig.add_trace(
+                go.Bar(
+                    x=summary['years'],
+                    y=summary['forecast_shares'][:, k],
+                    name=score_name,
+                    marker_color=color,
+                    opacity=0.7,
+                    showlegend=False,
+                    legendgroup = score_name
+                ),
+                row=1, col=col
+            )
+        min_forecasted_year = summary['min_forecasted_year']
         score_fig.add_shape(
             dict(type='line', x0=min_forecasted_year, x1=min_forecasted_year, y0=0, y1=100, yref='paper', line={'dash': 'dash', 'color': 'black'}),
-            row=1, col=i+1
+            row=1, col=col
         )
-        score_fig.update_layout(legend_tracegroupgap=2)
     score_fig.update_layout(
         title='Score Distribution by Year', 
         barmode='stack'
@@ -1260,15 +1076,66 @@ def update_charts(n_clicks, city1, state1, include1, city2, state2, include2, ci
             yaxis_name: {'title': 'Percentage of Days'} if i == 1 else {},
         })
     score_fig.update_layout(legend_tracegroupgap=2)
+    return score_fig
+
+
+def build_score_average_figure(city_states, city_results):
+    """Yearly average score; the forecast is averaged across models, with the model range shaded."""
+    subplot_titles = [f"{city}, {state}" for city, state in city_states]
+    n_cities = len(city_states)
 
-    # Score Average
     avg_fig = make_subplots(rows=1, cols=n_cities, subplot_titles=subplot_titles)
-    for i, (traces, label) in enumerate(average_subplots):
-        for trace in traces:
-            avg_fig.add_trace(trace, row=1, col=i+1)
+    for col, city_result, show_legend in scored_cities(city_results):
+        # The shared year is already merged in the summary
+        summary = city_result['summary']
+        average_traces = [
+            go.Scatter(
+                x=summary['historical_years'], 
+                y=summary['historical_mean'], 
+                mode='lines', 
+                name='Historical', 
+                line=dict(color='#158cba', width=2),
+                showlegend=show_legend, 
+                legendgroup = 'avg_graphs__h'
+            ),
+            go.Scatter(
+                x=summary['forecast_years'], 
+                y=summary['forecast_mean'], 
+                mode='lines', 
+                name='Forecasted', 
+                line=dict(color='#ba1535', width=2), 
+                showlegend=show_legend,
+                legendgroup = 'avg_graphs__f'
+            ),
+            go.Scatter(
+                name='Upper Bound',
+                x=summary['forecast_years'],
+                y=summary['forecast_max'],
+                mode='lines',
+                marker=dict(color="#444"),
+                line=dict(width=0),
+                showlegend=False, 
+                legendgroup = 'avg_graphs__f'
+            ),
+            go.Scatter(
+                name='Lower Bound',
+                x=summary['forecast_years'],
+                y=summary['forecast_min'],
+                marker=dict(color="#444"),
+                line=dict(width=0),
+                mode='lines',
+                fillcolor='rgba(68, 68, 68, 0.3)',
+                fill='tonexty',
+                showlegend=False, 
+                legendgroup = 'avg_graphs__f'
+            )
+        ]
+        for trace in average_traces:
+            avg_fig.add_trace(trace, row=1, col=col)
+        min_forecasted_year = summary['min_forecasted_year']
         avg_fig.add_shape(
             dict(type='line', x0=min_forecasted_year, x1=min_forecasted_year, y0=20, y1=90, yref='paper', line={'dash': 'dash', 'color': 'black'}),
-            row=1, col=i+1
+            row=1, col=col
         )
     avg_fig.update_layout(
         title='Score Average by Year'
@@ -1281,15 +1148,45 @@ def update_charts(n_clicks, city1, state1, include1, city2, state2, include2, ci
             yaxis_name: {'title': 'Score Average'} if i == 1 else {},
         })
     avg_fig.update_layout(legend_tracegroupgap=2)
+    return avg_fig
+
+
+def build_monthly_figure(city_states, city_results):
+    """Monthly average score, one line per historical and forecasted year."""
+    subplot_titles = [f"{city}, {state}" for city, state in city_states]
+    n_cities = len(city_states)
+    months = np.arange(1, 13)
 
-    # Monthly Stacked
     monthly_fig = make_subplots(rows=1, cols=n_cities, subplot_titles=subplot_titles)
-    for i, (traces, label) in enumerate(monthly_stacked_subplots):
-        for trace in traces:
-            monthly_fig.add_trace(trace, row=1, col=i+1)
+    for col, city_result, show_legend in scored_cities(city_results):
+        summary = city_result['summary']
+        years_hist = summary['historical_years']
+        n_hist = len(years_hist)
+        hist_traces = []
+        for i, year in enumerate(years_hist):
+            year_data = summary['historical_monthly'][i]
+            has_data = ~np.isnan(year_data)
+            fade = 0.2 + 0.8 * (i + 1) / n_hist
+            hist_traces.append(
+                go.Scatter(x=months[has_data], y=year_data[has_data], mode='lines', name=f'{year}', line=dict(color=f'rgba(21, 140, 186,{fade})', width=2), showlegend=show_legend, legendgroup = f'{year}')
+            )
+        
+        years_fore = summary['forecast_years']
+        n_fore = len(years_fore)
+        fore_traces = []
+        for i, year in enumerate(years_fore):
+            year_data = summary['forecast_monthly'][i]
+            has_data = ~np.isnan(year_data)
+            fade = 0.2 + 0.8 * (n_fore - i) / n_fore
+            fore_traces.append(
+                go.Scatter(x=months[has_data], y=year_data[has_data], mode='lines', name=f'{year}', line=dict(color=f'rgba(186, 21, 53,{fade})', width=2), showlegend=show_legend, legendgroup = f'{year}')
+            )
+        for trace in hist_traces + fore_traces:
+            monthly_fig.add_trace(trace, row=1, col=col)
+    for i in range(1, n_cities + 1):
         monthly_fig.add_shape(
             dict(type='line', x0=5, x1=5, y0=0, y1=100, yref='paper', line={'dash': 'dash', 'color': 'rgba(0, 0, 0, 0)'}),
-            row=1, col=i+1
+            row=1, col=i
         )
     monthly_fig.update_layout(
         title='Monthly Average Stacked Scores by Year'
@@ -1312,15 +1209,118 @@ def update_charts(n_clicks, city1, state1, include1, city2, state2, include2, ci
     monthly_fig.update_layout(
         yaxis_title="Your Y-Axis Label"
     )
+    return monthly_fig
+
+
+def build_reason_figure(city_states, city_results):
+    """Number of days per reason and year; the forecast shows the mean with the range across models."""
+    subplot_titles = [f"{city}, {state}" for city, state in city_states]
+    n_cities = len(city_states)
+
+    # Define theme colors for consistent coloring
+    reason_to_color = {
+        "neutral": "#158cba",
+        "too hot, humid": "#3f15ba",
+        "too hot, dry": "#7a15ba",
+        "too cold, windy": "#ba15a1",
+        "too cold, still": "#ba1535",
+        "ideal sunny": "#ba6715",
+        "ideal overcast": "#b7ba15",
+        "light rain": "#43ba15",
+        "heavy rain": "#15ba67",
+        "snow": "#15b7ba"
+    }            
 
-    # Reason Distribution
     reason_fig = make_subplots(rows=1, cols=n_cities, subplot_titles=subplot_titles)
-    for i, (traces, label) in enumerate(reason_subplots):
-        for trace in traces:
-            reason_fig.add_trace(trace, row=1, col=i+1)
+    for col, city_result, show_legend in scored_cities(city_results):
+        # Year × reason counts, with the forecast mean/min/max across models and the shared year merged
+        summary = city_result['summary']
+        reason_index = {reason: i for i, reason in enumerate(summary['reasons'])}
+        reason_traces = []
+        for reason, color in reason_to_color.items():
+            added_trace = False  # Track whether we’ve added at least one visible trace
+
+            i = reason_index[reason]
+            has_historical = summary['reason_historical'][:, i].any()
+
+            # Historical trace (solid line)
+            if has_historical:
+                reason_traces.append(
+                    go.Scatter(
+                        x=summary['historical_years'],
+                        y=summary['reason_historical'][:, i],
+                        mode='lines',
+                        name=reason,
+                        line=dict(dash='solid', color=color),
+                        marker=dict(color=color),
+                        showlegend=show_legend, 
+                        legendgroup = reason
+                    )
+                )
+                added_trace = True
+
+            # Forecasted trace (dotted line)
+            if summary['reason_present'][i] and len(summary['forecast_years']):
+                reason_traces.append(
+                    go.Scatter(
+                        x=summary['forecast_years'],
+                        y=summary['reason_forecast_min'][:, i],
+                        mode='lines',
+                        name='Lower Bound '+reason,
+                        line=dict(width=0),
+                        marker=dict(color=color),
+                        showlegend=False,  # Only show legend if no historical
+                        legendgroup = reason
+                    )
+                )
+                reason_traces.append(
+                    go.Scatter(
+                        name='Upper Bound '+reason,
+                        x=summary['forecast_years'],
+                        y=summary['reason_forecast_max'][:, i],
+                        marker=dict(color=color),
+                        line=dict(width=0),
+                        mode='lines',
+                        fillcolor=hex_to_rgba(color, 0.3),
+                        fill='tonexty',
+                        showlegend=False, 
+                        legendgroup = reason
+                    )
+                )
+                reason_traces.append(
+                    go.Scatter(
+                        x=summary['forecast_years'],
+                        y=summary['reason_forecast_mean'][:, i],
+                        mode='lines',
+                        name=reason,
+                        line=dict(dash='solid', color=color),
+                        marker=dict(color=color),
+                        showlegend=not added_trace and show_legend,  # Only show legend if no historical
+                        legendgroup = reason
+                    )
+                )
+                added_trace = True
+
+            # If no data at all, add a dummy invisible trace to lock in the color
+            else:
+                reason_traces.append(
+                    go.Scatter(
+                        x=[None],
+                        y=[None],
+                        mode='lines',
+                        name=reason,
+                        line=dict(dash='solid', color=color),
+                        marker=dict(color=color),
+                        showlegend=show_legend,
+                        legendgroup = reason
+                    )
+                )
+        for trace in reason_traces:
+            reason_fig.add_trace(trace, row=1, col=col)
+        min_forecasted_year = summary['min_forecasted_year']
         reason_fig.add_shape(
             dict(type='line', x0=min_forecasted_year, x1=min_forecasted_year, y0=0, y1=250, yref='paper', line={'dash': 'dash', 'color': 'black'}),
-            row=1, col=i+1
+            row=1, col=col
         )
     reason_fig.update_layout(
         title='Number of Days by Type (Reason) per Year'
@@ -1333,12 +1333,29 @@ def update_charts(n_clicks, city1, state1, include1, city2, state2, include2, ci
             yaxis_name: {'title': 'Number of Days'} if i == 1 else {},
         })
     reason_fig.update_layout(legend_tracegroupgap=2)
+    return reason_fig
+
+
+def build_pm25_figure(city_states, city_results):
+    """Percentage of hours in each PM2.5 category per year."""
+    subplot_titles = [f"{city}, {state}" for city, state in city_states]
+    n_cities = len(city_states)
 
-    # PM2.5
     pm25_fig = make_subplots(rows=1, cols=n_cities, subplot_titles=subplot_titles)
-    for i, (traces, label) in enumerate(pm25_subplots):
-        for trace in traces:
-            pm25_fig.add_trace(trace, row=1, col=i+1)
+    for col, city_result, show_legend in scored_cities(city_results):
+        pm25_data = city_result['pm25_categories_df']
+        for category, color in zip(['Healthy', 'Moderate', 'Unhealthy for Sensitive', 'Unhealthy', 'Hazardous'], ['green', 'yellow', 'orange', 'red', 'purple']):
+            pm25_fig.add_trace(
+                go.Bar(
+                    x=pm25_data[category].index,
+                    y=pm25_data[category].values,
+                    name=category,
+                    marker_color=color,
+                    showlegend=show_legend,
+                    legendgroup = category
+                ),
+                row=1, col=col
+            )
     pm25_fig.update_layout(
         title='PM2.5 Air Quality Distribution by Year', 
         barmode='stack'
@@ -1351,8 +1368,19 @@ def update_charts(n_clicks, city1, state1, include1, city2, state2, include2, ci
             yaxis_name: {'title': 'Percentage of Hours'} if i == 1 else {},
         })
     pm25_fig.update_layout(legend_tracegroupgap=2)
+    return pm25_fig
+
+
+def build_map_figure(city_states, city_results):
+    """Map with a marker for every city that was found."""
+    # For the map, collect lat/lon and city labels
+    lats, lons, labels = [], [], []
+    for (city, state), city_result in zip(city_states, city_results):
+        if not isinstance(city_result, Exception):
+            lats.append(city_result['lat'])
+            lons.append(city_result['lon'])
+            labels.append(f"{city}, {state}")
 
-    # Build the map
     map_trace = go.Scattermap(
         lat=lats,
         lon=lons,
@@ -1372,12 +1400,68 @@ def update_charts(n_clicks, city1, state1, include1, city2, state2, include2, ci
             zoom=3
         )
     )
-    map_figure = go.Figure(data=[map_trace], layout=map_layout)
+    return go.Figure(data=[map_trace], layout=map_layout)
+
+
+# Charts rendered from the results store, each by its own callback
+CHART_BUILDERS = {
+    'score-distribution': build_score_distribution_figure,
+    'score-average': build_score_average_figure,
+    'monthly-stacked-scores': build_monthly_figure,
+    'reason-distribution': build_reason_figure,
+    'pm25-chart': build_pm25_figure,
+    'city-map': build_map_figure,
+}
+CHART_IDS = list(CHART_BUILDERS)
+
+
+def render_chart(results, chart_id):
+    """
+    Build one chart from the stored results of a request, reusing its serialized
+    figure when the request (or an identical earlier one) already rendered it.
+    """
+    if results is None:
+        raise PreventUpdate
+    entry = results_store.get(results['request_id'])
+    if entry is None:
+        # Evicted by newer requests; a newer results id is on its way
+        raise PreventUpdate
+    if chart_id in entry['figures']:
+        return json.loads(entry['figures'][chart_id])
+    figure = CHART_BUILDERS[chart_id](entry['city_states'], entry['city_results'])
+    entry['figures'][chart_id] = figure.to_json()
+    return figure
+
+
+@callback(Output('score-distribution', 'figure'), Input('results-store', 'data'))
+def update_score_distribution(results):
+    return render_chart(results, 'score-distribution')
+
+
+@callback(Output('score-average', 'figure'), Input('results-store', 'data'))
+def update_score_average(results):
+    return render_chart(results, 'score-average')
+
+
+@callback(Output('monthly-stacked-scores', 'figure'), Input('results-store', 'data'))
+def update_monthly_stacked_scores(results):
+    return render_chart(results, 'monthly-stacked-scores')
+
+
+@callback(Output('reason-distribution', 'figure'), Input('results-store', 'data'))
+def update_reason_distribution(results):
+    return render_chart(results, 'reason-distribution')
+
+
+@callback(Output('pm25-chart', 'figure'), Input('results-store', 'data'))
+def update_pm25_chart(results):
+    return render_chart(results, 'pm25-chart')
+
 
-    # Instead of joining with '<br>', use html.Div for each message
-    status_children = [html.Div(msg) for msg in status_msgs]
-    return score_fig, avg_fig, monthly_fig, reason_fig, pm25_fig, map_figure, status_children, gemini_text, location_gemini_div
+@callback(Output('city-map', 'figure'), Input('results-store', 'data'))
+def update_city_map(results):
+    return render_chart(results, 'city-map')
 
 # Run the app
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
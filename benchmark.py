@@ -0,0 +1,254 @@
+"""
+Benchmarks for the climate score data pipeline.
+
+Usage:
+    python benchmark.py cache [--repeat N]
+    python benchmark.py decode [--repeat N]
+    python benchmark.py memory
+
+The cache benchmark writes a synthetic frame for every data type in
+get_cache_filename, shaped like what the app caches for one city, in each
+available cache format and reports the file size and load time. Hourly
+weather and PM2.5 are also measured in the compact .npz stores the app keeps
+them in.
+
+The decode benchmark builds Open-Meteo responses (FlatBuffers, as the API
+returns them) for 10 years of daily and 4 years of hourly weather and times
+extract_data_from_api_response on them against the previous decoder.
+
+The memory benchmark reports the in-memory size of one city's cached frames
+as they used to load (from CSV: float64, int64 and object columns) and with
+the FRAME_SCHEMAS column types.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date
+
+import flatbuffers
+import numpy as np
+import pandas as pd
+from openmeteo_sdk.Unit import Unit
+from openmeteo_sdk.VariablesWithTime import VariablesWithTime
+
+from helper import (
+    CACHE_DATA_TYPES, CACHE_FORMATS, DEFAULT_CACHE_FORMAT, FIRING_PRIMARY, FRAME_SCHEMAS, HOURLY_STORE_EXTENSION,
+    PM25_STORE_EXTENSION, apply_frame_schema, extract_data_from_api_response, pm25_store_from_frame,
+    read_array_file, read_cache_file, read_pm25_store, write_array_file, write_cache_file
+)
+
+MODELS = ["EC_Earth3P_HR", "MRI_AGCM3_2_S", "NICAM16_8S"]
+WEATHER_COLUMNS = [
+    "temperature_2m_max__celsius", "dew_point_2m_min__celsius", "rain_sum__millimetre",
+    "snowfall_sum__centimetre", "cloud_cover_mean__percentage", "wind_speed_10m_mean__kilometres_per_hour"
+]
+
+
+def _weather(rng, n_rows, suffix=""):
+    return {col + suffix: rng.uniform(-10, 40, n_rows).astype(np.float32) for col in WEATHER_COLUMNS}
+
+
+def _firings(rng, n_rows):
+    return rng.integers(0, len(FIRING_PRIMARY), n_rows, dtype=np.uint8)
+
+
+def synthetic_frame(data_type, rng):
+    """Build a frame shaped like the cached data for one city."""
+    today = date.today()
+    if data_type in ("historical_daily", "historical_score", "historical_hourly_score"):
+        dates = pd.date_range(date(today.year - 10, 1, 2), today, freq="D")
+    elif data_type in ("historical_hourly", "historical_pm25"):
+        start = date(today.year - 10, 1, 2) if data_type == "historical_hourly" else date(2022, 1, 1)
+        dates = pd.date_range(start, today, freq="h", tz="UTC").tz_convert("America/New_York")
+    else:
+        dates = pd.date_range(today, date(today.year + 24, 12, 31), freq="D")
+
+    if data_type in ("historical_hourly", "historical_pm25"):
+        df = pd.DataFrame({"datetime": dates, "date": dates.date, "time": dates.time})
+        if data_type == "historical_pm25":
+            df["pm2_5__micrograms_per_cubic_metre"] = rng.gamma(2, 4, len(df)).astype(np.float32)
+        else:
+            for col, values in _weather(rng, len(df)).items():
+                df[col] = values
+        return df
+
+    df = pd.DataFrame({"date": dates.date})
+    if data_type == "historical_daily":
+        df = df.assign(**_weather(rng, len(df)))
+    elif data_type == "forecasted":
+        df = df.assign(**_weather(rng, len(df), f"__{MODELS[-1]}"))
+    elif data_type == "combined_forecasted":
+        for model in MODELS:
+            df = df.assign(**_weather(rng, len(df), f"__{model}"))
+        df["year"] = pd.to_datetime(df["date"]).dt.year
+    elif data_type in ("historical_score", "historical_hourly_score", "forecasted_score"):
+        df["firing"] = _firings(rng, len(df))
+        df["year"] = pd.to_datetime(df["date"]).dt.year
+    elif data_type == "combined_forecasted_score":
+        df["year"] = pd.to_datetime(df["date"]).dt.year
+        for model in MODELS:
+            df[f"firing_{model}"] = _firings(rng, len(df))
+    return df
+
+
+def _best_time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_cache(repeat):
+    """Compare load times of every cache format for each data type."""
+    # Parquet and Feather both need pyarrow, which also decides the default format
+    formats = list(CACHE_FORMATS) if DEFAULT_CACHE_FORMAT != "csv" else ["csv"]
+
+    rng = np.random.default_rng(0)
+    header = f"{'data_type':<28}{'rows':>8}" + "".join(f"{fmt + ' KB':>14}{fmt + ' ms':>14}" for fmt in formats)
+    print(header)
+    print("-" * len(header))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for data_type in CACHE_DATA_TYPES:
+            if data_type == "score_summary":
+                # A few KB of aggregates, not a frame
+                continue
+            df = synthetic_frame(data_type, rng)
+            row = f"{data_type:<28}{len(df):>8}"
+            for cache_format in formats:
+                filename = os.path.join(tmp_dir, data_type + CACHE_FORMATS[cache_format]["extension"])
+                write_cache_file(df, filename)
+                load_time = _best_time(lambda: read_cache_file(filename), repeat)
+                row += f"{os.path.getsize(filename) / 1024:>14.0f}{load_time * 1000:>14.1f}"
+            print(row)
+
+            if data_type == "historical_pm25":
+                # What the app actually caches for PM2.5: the compact hourly store
+                filename = os.path.join(tmp_dir, data_type + PM25_STORE_EXTENSION)
+                write_array_file(pm25_store_from_frame(df, "America/New_York"), filename)
+                load_time = _best_time(lambda: read_pm25_store(filename), repeat)
+                print(f"{'  as ' + PM25_STORE_EXTENSION + ' store':<36}{os.path.getsize(filename) / 1024:>14.0f}{load_time * 1000:>14.1f}")
+            elif data_type == "historical_hourly":
+                # The hourly weather store: a (variables, hours) float32 array on an implicit time index
+                filename = os.path.join(tmp_dir, data_type + HOURLY_STORE_EXTENSION)
+                values = np.vstack([df[col].to_numpy() for col in WEATHER_COLUMNS])
+                start = int(df["datetime"].iloc[0].timestamp())
+                write_array_file({"start": np.int64(start), "interval": np.int64(3600), "values": values}, filename)
+                load_time = _best_time(lambda: read_array_file(filename), repeat)
+                print(f"{'  as ' + HOURLY_STORE_EXTENSION + ' store':<36}{os.path.getsize(filename) / 1024:>14.0f}{load_time * 1000:>14.1f}")
+
+
+def synthetic_response(start, end, interval, n_variables, rng):
+    """Build a VariablesWithTime table (a Daily() or Hourly() block) like the API sends."""
+    n_steps = (end - start) // interval
+    builder = flatbuffers.Builder(n_variables * n_steps * 4 + 1024)
+    variables = []
+    for _ in range(n_variables):
+        values = builder.CreateNumpyVector(rng.uniform(-10, 40, n_steps).astype(np.float32))
+        # VariableWithValues fields: 1 = unit, 3 = values (13 fields in all)
+        builder.StartObject(13)
+        builder.PrependUint8Slot(1, Unit.celsius, 0)
+        builder.PrependUOffsetTRelativeSlot(3, values, 0)
+        variables.append(builder.EndObject())
+    builder.StartVector(4, len(variables), 4)
+    for variable in reversed(variables):
+        builder.PrependUOffsetTRelative(variable)
+    variables = builder.EndVector()
+    # VariablesWithTime fields: time, time_end, interval, variables
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, start, 0)
+    builder.PrependInt64Slot(1, end, 0)
+    builder.PrependInt32Slot(2, interval, 0)
+    builder.PrependUOffsetTRelativeSlot(3, variables, 0)
+    builder.Finish(builder.EndObject())
+    return VariablesWithTime.GetRootAs(builder.Output(), 0)
+
+
+def _extract_previous(timeseries, cols, hourly=True, timezone="America/Los_Angeles"):
+    """The decoder before the rewrite: object date/time columns and an enum scan per column."""
+    datetime_index = pd.date_range(
+        start=pd.to_datetime(timeseries.Time(), unit="s", utc=True),
+        end=pd.to_datetime(timeseries.TimeEnd(), unit="s", utc=True),
+        freq=pd.Timedelta(seconds=timeseries.Interval()),
+        inclusive="left"
+    )
+    if hourly:
+        datetime_index = datetime_index.tz_convert(timezone)
+    df_dict = {"datetime": datetime_index, "date": datetime_index.date}
+    if hourly:
+        df_dict["time"] = datetime_index.time
+    i = 0
+    while True:
+        try:
+            unit = next(name for name, value in Unit.__dict__.items()
+                        if value == timeseries.Variables(i).Unit() and not name.startswith("__"))
+            df_dict[cols[i] + "__" + unit] = timeseries.Variables(i).ValuesAsNumpy()
+            i += 1
+        except Exception:
+            break
+    return pd.DataFrame(data=df_dict)
+
+
+def benchmark_decode(repeat):
+    """Time decoding a 10-year daily and a 4-year hourly response."""
+    rng = np.random.default_rng(0)
+    today = pd.Timestamp(date.today(), tz="UTC")
+    cases = [
+        ("daily, 10 years", 86400, today - pd.DateOffset(years=10), False),
+        ("hourly, 4 years", 3600, today - pd.DateOffset(years=4), True),
+    ]
+    header = f"{'response':<20}{'rows':>8}{'previous ms':>14}{'current ms':>14}{'speedup':>10}"
+    print(header)
+    print("-" * len(header))
+    for label, interval, start, hourly in cases:
+        timeseries = synthetic_response(int(start.timestamp()), int(today.timestamp()), interval,
+                                        len(WEATHER_COLUMNS), rng)
+        cols = [col.split("__")[0] for col in WEATHER_COLUMNS]
+        decode = lambda: extract_data_from_api_response(timeseries, cols, hourly, "America/New_York")
+        previous = lambda: _extract_previous(timeseries, cols, hourly, "America/New_York")
+        rows = len(decode())
+        previous_time = _best_time(previous, repeat)
+        current_time = _best_time(decode, repeat)
+        print(f"{label:<20}{rows:>8}{previous_time * 1000:>14.1f}{current_time * 1000:>14.1f}"
+              f"{previous_time / current_time:>9.1f}x")
+
+
+def benchmark_memory():
+    """Compare the memory of one city's frames loaded from CSV and with the typed schema."""
+    rng = np.random.default_rng(0)
+    header = f"{'data_type':<28}{'rows':>8}{'untyped MB':>14}{'typed MB':>14}{'reduction':>12}"
+    print(header)
+    print("-" * len(header))
+    totals = np.zeros(2)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for data_type in FRAME_SCHEMAS:
+            # What the app held before the schema: the frame as read back from a CSV cache
+            filename = os.path.join(tmp_dir, data_type + ".csv")
+            write_cache_file(synthetic_frame(data_type, rng), filename)
+            untyped = read_cache_file(filename)
+            typed = apply_frame_schema(untyped, data_type)
+            sizes = np.array([frame.memory_usage(deep=True).sum() / 1024 ** 2 for frame in (untyped, typed)])
+            totals += sizes
+            print(f"{data_type:<28}{len(typed):>8}{sizes[0]:>14.2f}{sizes[1]:>14.2f}{1 - sizes[1] / sizes[0]:>12.0%}")
+    print("-" * len(header))
+    print(f"{'per city':<36}{totals[0]:>14.2f}{totals[1]:>14.2f}{1 - totals[1] / totals[0]:>12.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    cache_parser = subparsers.add_parser("cache", help="compare cache format load times")
+    cache_parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (best is reported)")
+    decode_parser = subparsers.add_parser("decode", help="time decoding Open-Meteo responses")
+    decode_parser.add_argument("--repeat", type=int, default=20, help="runs per measurement (best is reported)")
+    subparsers.add_parser("memory", help="compare in-memory frame sizes with and without the typed schema")
+    args = parser.parse_args()
+
+    if args.benchmark == "cache":
+        benchmark_cache(args.repeat)
+    elif args.benchmark == "decode":
+        benchmark_decode(args.repeat)
+    elif args.benchmark == "memory":
+        benchmark_memory()
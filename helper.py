@@ -5,14 +5,25 @@ import numpy as np
 
 import datetime as dt
 from datetime import date
+from dataclasses import dataclass, replace
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
 import openmeteo_requests
 
 import os
+import re
 import hashlib
 import json
 import time
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from functools import lru_cache
+from collections import OrderedDict
 
 
 class Score:
@@ -23,6 +34,12 @@ class Score:
     # Valid coefficient values
     VALID_COEFFICIENTS = [-2, -1, 0, 1, 2]
     
+    def __setattr__(self, name, value):
+        # Drop the compiled rules whenever a parameter actually changes
+        if name != '_rules' and self.__dict__.get(name, _UNSET) != value:
+            self.__dict__['_rules'] = None
+        super().__setattr__(name, value)
+    
     def __init__(self):
         # Time window preferences (default: 8 AM to 8 PM)
         # what hours of the day matter the most to you for being outside?
@@ -133,6 +150,13 @@ class Score:
             'dry_heat_day_coef': self.dry_heat_day_coef
         }
     
+    def get_threshold_parameters(self):
+        """
+        Get the parameters that decide which rules fire on a day: all of them but
+        the coefficients, which only choose the score of a rule that fired.
+        """
+        return {key: value for key, value in self.get_all_parameters().items() if not key.endswith('_coef')}
+    
     def set_all_parameters(self, params_dict):
         """Set all parameters from a dictionary."""
         for key, value in params_dict.items():
@@ -146,21 +170,105 @@ class Score:
         # Recalculate scaling factor if time window changed
         if 'min_time' in params_dict or 'max_time' in params_dict:
             self._calculate_scaling_factor()
+    
+    def compile(self):
+        """
+        Return the ScoreRules for the current parameters.
+        The rules are built once and reused until a parameter changes.
+        """
+        if self._rules is None:
+            self._rules = ScoreRules(
+                humid_temp_c=f_to_c(self.humid_day_max),
+                humid_dew_point_c=f_to_c(60),
+                dry_heat_temp_c=f_to_c(self.dry_heat_day_min),
+                cold_windy_temp_c=f_to_c(self.too_cold_windy__max),
+                cold_still_temp_c=f_to_c(self.too_cold_still__max),
+                ideal_temp_min_c=f_to_c(self.ideal_temp__min),
+                ideal_temp_max_c=f_to_c(self.ideal_temp__max),
+                humid_coef=self.humid_day_coef,
+                dry_heat_coef=self.dry_heat_day_coef,
+                cold_windy_coef=self.too_cold_windy__coef,
+                cold_still_coef=self.too_cold_still__coef,
+                sunny_coef=self.ideal_sunny_day__coef,
+                overcast_coef=self.overcast_dry__coef,
+                light_rain_coef=self.light_rain__coef,
+                heavy_rain_coef=self.heavy_rain__coef,
+                snow_coef=self.snow_coef,
+                scaling_factor=self.scaling_factor,
+            )
+        return self._rules
+
+
+_UNSET = object()
+
+# ScoreRules fields that only pick a score and never affect which rules fire
+_COEF_FIELDS = ('humid_coef', 'dry_heat_coef', 'cold_windy_coef', 'cold_still_coef', 'sunny_coef',
+                'overcast_coef', 'light_rain_coef', 'heavy_rain_coef', 'snow_coef')
+
+
+@dataclass(frozen=True)
+class ScoreRules:
+    """
+    Immutable, hashable rule table compiled from a Score.
+    Temperature thresholds are already converted to Celsius, so the scoring
+    functions can compare against them directly.
+    """
+    humid_temp_c: float
+    humid_dew_point_c: float
+    dry_heat_temp_c: float
+    cold_windy_temp_c: float
+    cold_still_temp_c: float
+    ideal_temp_min_c: float
+    ideal_temp_max_c: float
+    humid_coef: int
+    dry_heat_coef: int
+    cold_windy_coef: int
+    cold_still_coef: int
+    sunny_coef: int
+    overcast_coef: int
+    light_rain_coef: int
+    heavy_rain_coef: int
+    snow_coef: int
+    scaling_factor: float
+    # Fixed thresholds (km/h, %, mm, cm)
+    windy_speed: float = 30
+    overcast_cloud_cover: float = 60
+    light_rain_min: float = 2
+    heavy_rain_min: float = 10
+    snowfall_min: float = 1
+    
+    @property
+    def coefs(self):
+        """Coefficients in the order of SCORE_REASONS ('neutral' is always 0)."""
+        return (0, self.humid_coef, self.dry_heat_coef, self.cold_windy_coef, self.cold_still_coef,
+                self.sunny_coef, self.overcast_coef, self.light_rain_coef, self.heavy_rain_coef, self.snow_coef)
+    
+    def compile(self):
+        """Rules are already compiled; lets scoring functions accept either a Score or ScoreRules."""
+        return self
 
 
 ####### Helper functions to extract information from the API response
+def _reverse_lookup(enum_class):
+    """Map each value of an SDK enum class to its (first) name."""
+    names = {}
+    for name, value in vars(enum_class).items():
+        if not name.startswith("__"):
+            names.setdefault(value, name)
+    return names
+
+
+# Built once, so decoding a column is a dict lookup rather than a scan of the enum
+UNIT_NAMES = _reverse_lookup(Unit)
+VARIABLE_NAMES = _reverse_lookup(Variable)
+
+
 def get_unit_name(unit_value):
-    for name, value in Unit.__dict__.items():
-        if value == unit_value and not name.startswith("__"):
-            return name
-    return f"unknown({unit_value})"
+    return UNIT_NAMES.get(unit_value, f"unknown({unit_value})")
 
 
 def get_variable_name(var_value):
-    for name, value in Variable.__dict__.items():
-        if value == var_value and not name.startswith("__"):
-            return name
-    return f"unknown({var_value})"
+    return VARIABLE_NAMES.get(var_value, f"unknown({var_value})")
 
 def hex_to_rgba(hex_color, alpha):
     """Converts a hex color code to an RGBA string with specified alpha."""
@@ -170,44 +278,42 @@ def hex_to_rgba(hex_color, alpha):
 
 
 def extract_data_from_api_response(timeseries, cols, hourly = True, timezone = 'America/Los_Angeles'):
+	"""
+	Decode an Open-Meteo daily or hourly response into a DataFrame.
+	
+	The value columns wrap the response's float32 buffers without copying, and the
+	time columns are datetime64 rather than Python date/time objects.
+	
+	Args:
+		timeseries: Daily() or Hourly() of an Open-Meteo response
+		cols: requested variable names, in request order
+		hourly: whether timeseries is hourly; hourly times are converted to timezone
+		timezone: timezone name for hourly data
+	
+	Returns:
+		DataFrame with datetime (tz-aware), date (datetime64 day), for hourly data time
+		(timedelta64 time of day), and a `<col>__<unit>` column per variable
+	"""
+	datetime_index = pd.date_range(
+	    start=pd.to_datetime(timeseries.Time(), unit="s", utc=True),
+	    end=pd.to_datetime(timeseries.TimeEnd(), unit="s", utc=True),
+	    freq=pd.Timedelta(seconds=timeseries.Interval()),
+	    inclusive="left"
+	)
 	if hourly:
-		datetime_index = pd.date_range(
-		    start=pd.to_datetime(timeseries.Time(), unit="s", utc=True),
-		    end=pd.to_datetime(timeseries.TimeEnd(), unit="s", utc=True),
-		    freq=pd.Timedelta(seconds=timeseries.Interval()),
-		    inclusive="left"
-		)
-
-		# Convert DatetimeIndex to timezone-aware datetime
 		datetime_index = datetime_index.tz_convert(timezone)  # e.g., "America/Los_Angeles"
+	wall_clock = datetime_index.tz_localize(None)
+
+	df_dict = {}
+	df_dict["datetime"] = datetime_index
+	df_dict["date"] = wall_clock.normalize()
+	if hourly:
+		df_dict["time"] = wall_clock - df_dict["date"]
 
-		# Construct DataFrame from converted index
-		df_dict = {}
-		df_dict["datetime"] = datetime_index
-		df_dict["date"] = datetime_index.date
-		df_dict["time"] = datetime_index.time
-	else: 
-		datetime_index = pd.date_range(
-		    start=pd.to_datetime(timeseries.Time(), unit="s", utc=True),
-		    end=pd.to_datetime(timeseries.TimeEnd(), unit="s", utc=True),
-		    freq=pd.Timedelta(seconds=timeseries.Interval()),
-		    inclusive="left"
-		)
-		df_dict = {}
-		df_dict["datetime"] = datetime_index
-		df_dict["date"] = datetime_index.date
-
-	i = 0
-	while True:
-		try: 
-			col_name = cols[i] + "__" + \
-				get_unit_name(timeseries.Variables(i).Unit())
-			df_dict[col_name] = timeseries.Variables(i).ValuesAsNumpy()
-			i+=1
-			continue
-		except:
-			break
-	return pd.DataFrame(data = df_dict)
+	for i in range(min(timeseries.VariablesLength(), len(cols))):
+		variable = timeseries.Variables(i)
+		df_dict[cols[i] + "__" + get_unit_name(variable.Unit())] = variable.ValuesAsNumpy()
+	return pd.DataFrame(data = df_dict, copy = False)
 
 
 ####### Helper functions to calculate the climate score
@@ -222,55 +328,56 @@ def daily_climate_score__hourly(temperature_arr,
 								wind_arr, 
 								cloud_cover_arr,
 								score_obj):
+	rules = score_obj.compile()
 	score = 0
 	reason = "neutral"
     #this if/elif loop should logically be disjoint
-	if (np.max(temperature_arr) > f_to_c(score_obj.humid_day_max) and np.min(dew_point_arr) > f_to_c(60)):
-		score = score_obj.humid_day_coef
+	if (np.max(temperature_arr) > rules.humid_temp_c and np.min(dew_point_arr) > rules.humid_dew_point_c):
+		score = rules.humid_coef
 		reason = "too hot, humid"
-	elif (np.max(temperature_arr) > f_to_c(score_obj.dry_heat_day_min) and np.min(dew_point_arr) <= f_to_c(60)):
-		score = score_obj.dry_heat_day_coef
+	elif (np.max(temperature_arr) > rules.dry_heat_temp_c and np.min(dew_point_arr) <= rules.humid_dew_point_c):
+		score = rules.dry_heat_coef
 		reason = "too hot, dry"
-	elif (np.max(temperature_arr) < f_to_c(score_obj.too_cold_windy__max) and np.mean(wind_arr) > 30):
-		score = score_obj.too_cold_windy__coef
+	elif (np.max(temperature_arr) < rules.cold_windy_temp_c and np.mean(wind_arr) > rules.windy_speed):
+		score = rules.cold_windy_coef
 		reason = "too cold, windy"
-	elif (np.max(temperature_arr) < f_to_c(score_obj.too_cold_still__max) and np.mean(wind_arr) < 30):
-		score = score_obj.too_cold_still__coef
+	elif (np.max(temperature_arr) < rules.cold_still_temp_c and np.mean(wind_arr) < rules.windy_speed):
+		score = rules.cold_still_coef
 		reason = "too cold, still"
-	elif (np.max(temperature_arr) > f_to_c(score_obj.ideal_temp__min) and np.max(temperature_arr) < f_to_c(score_obj.ideal_temp__max)):
-		if (np.mean(cloud_cover_arr) < 60 and np.sum(rain_arr) < 2):
-			score = score_obj.ideal_sunny_day__coef
+	elif (np.max(temperature_arr) > rules.ideal_temp_min_c and np.max(temperature_arr) < rules.ideal_temp_max_c):
+		if (np.mean(cloud_cover_arr) < rules.overcast_cloud_cover and np.sum(rain_arr) < rules.light_rain_min):
+			score = rules.sunny_coef
 			reason = "ideal sunny"
-		elif (np.mean(cloud_cover_arr) >=60 and np.sum(rain_arr) < 2):
-			score = score_obj.overcast_dry__coef
+		elif (np.mean(cloud_cover_arr) >= rules.overcast_cloud_cover and np.sum(rain_arr) < rules.light_rain_min):
+			score = rules.overcast_coef
 			reason = "ideal overcast"
 	# Precipitation overrides
-	if (np.sum(rain_arr) >= 2 and np.sum(rain_arr) < 10):
+	if (np.sum(rain_arr) >= rules.light_rain_min and np.sum(rain_arr) < rules.heavy_rain_min):
 		if reason == 'neutral':
-			score = score_obj.light_rain__coef
+			score = rules.light_rain_coef
 			reason = 'light rain'
 		else:
 			prev_score = score
-			score = np.min([score, score_obj.light_rain__coef])
-			if score == score_obj.light_rain__coef or score < prev_score:
+			score = np.min([score, rules.light_rain_coef])
+			if score == rules.light_rain_coef or score < prev_score:
 				reason = "light rain"
-	elif (np.sum(rain_arr) >= 10):
+	elif (np.sum(rain_arr) >= rules.heavy_rain_min):
 		if reason == 'neutral':
-			score = score_obj.heavy_rain__coef
+			score = rules.heavy_rain_coef
 			reason = "heavy rain"
 		else:
 			prev_score = score
-			score = np.min([score, score_obj.heavy_rain__coef])
-			if score == score_obj.heavy_rain__coef or score < prev_score:
+			score = np.min([score, rules.heavy_rain_coef])
+			if score == rules.heavy_rain_coef or score < prev_score:
 				reason = "heavy rain"
-	elif (np.sum(snowfall_arr) > 1):
+	elif (np.sum(snowfall_arr) > rules.snowfall_min):
 		if reason == 'neutral':
-			score = score_obj.snow_coef
+			score = rules.snow_coef
 			reason = "snow"
 		else:
 			prev_score = score
-			score = np.min([score, score_obj.snow_coef])
-			if score == score_obj.snow_coef or score < prev_score:
+			score = np.min([score, rules.snow_coef])
+			if score == rules.snow_coef or score < prev_score:
 				reason = "snow"
 	return (score + 2) * 25, reason
 
@@ -282,525 +389,2492 @@ def daily_climate_score__daily(temperature_max,
 								snowfall_sum, 
 								scaling_factor,
 								score_obj):
+	rules = score_obj.compile()
 	score = 0
 	reason = "neutral"
-	if (temperature_max > f_to_c(score_obj.humid_day_max) and dew_point_min > f_to_c(60)):
-		score = score_obj.humid_day_coef
+	if (temperature_max > rules.humid_temp_c and dew_point_min > rules.humid_dew_point_c):
+		score = rules.humid_coef
 		reason = "too hot, humid"
-	elif (temperature_max > f_to_c(score_obj.dry_heat_day_min) and dew_point_min <= f_to_c(60)):
-		score = score_obj.dry_heat_day_coef
+	elif (temperature_max > rules.dry_heat_temp_c and dew_point_min <= rules.humid_dew_point_c):
+		score = rules.dry_heat_coef
 		reason = "too hot, dry"
-	elif (temperature_max < f_to_c(score_obj.too_cold_windy__max) and wind_mean > 30):
-		score = score_obj.too_cold_windy__coef
+	elif (temperature_max < rules.cold_windy_temp_c and wind_mean > rules.windy_speed):
+		score = rules.cold_windy_coef
 		reason = "too cold, windy"
-	elif (temperature_max < f_to_c(score_obj.too_cold_still__max) and wind_mean < 30):
-		score = score_obj.too_cold_still__coef
+	elif (temperature_max < rules.cold_still_temp_c and wind_mean < rules.windy_speed):
+		score = rules.cold_still_coef
 		reason = "too cold, still"
-	elif (temperature_max > f_to_c(score_obj.ideal_temp__min) and temperature_max < f_to_c(score_obj.ideal_temp__max)):
-		if (cloud_cover_mean < 60 and scaling_factor*rain_sum < 2):
-			score = score_obj.ideal_sunny_day__coef
+	elif (temperature_max > rules.ideal_temp_min_c and temperature_max < rules.ideal_temp_max_c):
+		if (cloud_cover_mean < rules.overcast_cloud_cover and scaling_factor*rain_sum < rules.light_rain_min):
+			score = rules.sunny_coef
 			reason = "ideal sunny"
-		elif (cloud_cover_mean >=60 and scaling_factor*rain_sum < 2):
-			score = score_obj.overcast_dry__coef
+		elif (cloud_cover_mean >= rules.overcast_cloud_cover and scaling_factor*rain_sum < rules.light_rain_min):
+			score = rules.overcast_coef
 			reason = "ideal overcast"
 	# Precipitation overrides
     # Precipitation overrides
-	if (scaling_factor*rain_sum >=2 and scaling_factor*rain_sum < 10):
+	if (scaling_factor*rain_sum >= rules.light_rain_min and scaling_factor*rain_sum < rules.heavy_rain_min):
 		if reason == 'neutral':
-			score = score_obj.light_rain__coef
+			score = rules.light_rain_coef
 			reason = 'light rain'
 		else:
 			prev_score = score
-			score = np.min([score, score_obj.light_rain__coef])
-			if score == score_obj.light_rain__coef or score < prev_score:
+			score = np.min([score, rules.light_rain_coef])
+			if score == rules.light_rain_coef or score < prev_score:
 				reason = "light rain"
-	elif (scaling_factor*rain_sum >=10):
+	elif (scaling_factor*rain_sum >= rules.heavy_rain_min):
 		if reason == 'neutral':
-			score = score_obj.heavy_rain__coef
+			score = rules.heavy_rain_coef
 			reason = "heavy rain"
 		else:
 			prev_score = score
-			score = np.min([score, score_obj.heavy_rain__coef])
-			if score == score_obj.heavy_rain__coef or score < prev_score:
+			score = np.min([score, rules.heavy_rain_coef])
+			if score == rules.heavy_rain_coef or score < prev_score:
 				reason = "heavy rain"
-	elif (snowfall_sum > 1):
+	elif (snowfall_sum > rules.snowfall_min):
 		if reason == 'neutral':
-			score = score_obj.snow_coef
+			score = rules.snow_coef
 			reason = "snow"
 		else:
 			prev_score = score
-			score = np.min([score, score_obj.snow_coef])
-			if score == score_obj.snow_coef or score < prev_score:
+			score = np.min([score, rules.snow_coef])
+			if score == rules.snow_coef or score < prev_score:
 				reason = "snow"
 	return (score + 2) * 25, reason
 
-def get_city_info(city, state):
-    url = f'https://geocoding-api.open-meteo.com/v1/search?name={city}&count=100'
-    response = requests.get(url)
-    data = response.json()
-    filtered_data = [item for item in data['results'] if item['country_code'] == 'US' and item['admin1'] == state]
-    if not filtered_data:
-        raise ValueError(f"No results found for {city}, {state}")
-    info = filtered_data[0]
-    return info['latitude'], info['longitude'], info['timezone'], info.get('population', None)
-
-
-def get_historical_and_aqi_data(lat, long, city_timezone, city, state, col_names=None, save_csv=True):
-    if col_names is None:
-        col_names = [
-            "temperature_2m_max", "dew_point_2m_min", "rain_sum", "snowfall_sum", "cloud_cover_mean", "wind_speed_10m_mean"
-        ]
-    # Check cache first
-    cache_filename_weather = get_cache_filename("historical_daily", city, state)
-    cache_filename_pm25 = get_cache_filename("historical_pm25", city, state)
-    cached_weather = load_cached_data(cache_filename_weather)
-    cached_pm25 = load_cached_data(cache_filename_pm25)
-    if cached_weather is not None and cached_pm25 is not None:
-        print(f"Loading historical daily weather from cache: {cache_filename_weather}")
-        print(f"Loading historical pm2.5 from cache: {cache_filename_pm25}")
-        return cached_weather, cached_pm25, cache_filename_weather, cache_filename_pm25
+# Every reason the daily scoring rules can produce, in the order the rules are
+# evaluated. Index 0 is the fall-through "neutral" outcome.
+SCORE_REASONS = [
+    "neutral",
+    "too hot, humid",
+    "too hot, dry",
+    "too cold, windy",
+    "too cold, still",
+    "ideal sunny",
+    "ideal overcast",
+    "light rain",
+    "heavy rain",
+    "snow",
+]
 
-    print(f"Fetching historical daily weather for {city}, {state} from API...")
-    openmeteo = openmeteo_requests.Client()
 
-    # Historical daily weather
-    url = "https://archive-api.open-meteo.com/v1/archive"
-    params = {
-        "latitude": lat,
-        "longitude": long,
-        "start_date": date(date.today().year - 10, 1, 2),
-        "end_date": date.today(),
-        "daily": col_names,
-        "timezone": 'GMT'
-    }
-    responses = openmeteo.weather_api(url, params=params)
-    df_historical_weather = extract_data_from_api_response(responses[0].Daily(), col_names, hourly=False)
+def _rule_firings(temperature_max,
+                  dew_point_min,
+                  wind_mean,
+                  cloud_cover_mean,
+                  rain_sum,
+                  snowfall_sum,
+                  scaling_factor,
+                  rules):
+    """
+    Find which primary rule and which precipitation rule fire on each day.
 
-    # AQI (pm2.5, hourly)
-    url = "https://air-quality-api.open-meteo.com/v1/air-quality"
-    aqi_col_names = ["pm2_5"]
-    params = {
-        "latitude": lat,
-        "longitude": long,
-        "hourly": aqi_col_names,
-        "start_date": "2022-01-01",
-        "end_date": date.today(),
-        "timezone": 'GMT'
-    }
-    responses = openmeteo.weather_api(url, params=params)
-    df_historical_aqi = extract_data_from_api_response(responses[0].Hourly(), aqi_col_names, timezone=city_timezone)
+    Both results are indices into SCORE_REASONS (0 when no rule of that kind
+    fires). They depend on the thresholds only, not on the coefficients.
+    Weather arrays are float64 with one entry per day.
+    """
+    rain = scaling_factor * rain_sum
+    is_ideal = (temperature_max > rules.ideal_temp_min_c) & (temperature_max < rules.ideal_temp_max_c)
+    # np.select picks the first matching condition, mirroring the if/elif chain
+    primary = np.select(
+        [
+            (temperature_max > rules.humid_temp_c) & (dew_point_min > rules.humid_dew_point_c),
+            (temperature_max > rules.dry_heat_temp_c) & (dew_point_min <= rules.humid_dew_point_c),
+            (temperature_max < rules.cold_windy_temp_c) & (wind_mean > rules.windy_speed),
+            (temperature_max < rules.cold_still_temp_c) & (wind_mean < rules.windy_speed),
+            is_ideal & (cloud_cover_mean < rules.overcast_cloud_cover) & (rain < rules.light_rain_min),
+            is_ideal & (cloud_cover_mean >= rules.overcast_cloud_cover) & (rain < rules.light_rain_min),
+        ],
+        np.arange(1, 7, dtype=np.uint8),
+        default=np.uint8(0)
+    )
+    precipitation = np.select(
+        [(rain >= rules.light_rain_min) & (rain < rules.heavy_rain_min), rain >= rules.heavy_rain_min, snowfall_sum > rules.snowfall_min],
+        np.arange(7, 10, dtype=np.uint8),
+        default=np.uint8(0)
+    )
+    return primary, precipitation
 
-    # Save to cache
-    if save_csv:
-        save_cached_data(df_historical_weather, cache_filename_weather)
-        save_cached_data(df_historical_aqi, cache_filename_pm25)
-    else:
-        cache_filename_weather = None
-        cache_filename_pm25 = None
 
-    return df_historical_weather, df_historical_aqi, cache_filename_weather, cache_filename_pm25
+def _resolve_outcomes(primary, precipitation, coefs):
+    """
+    Apply the precipitation overrides to the primary rule, returning the index
+    into SCORE_REASONS of the rule that decides each day.
 
+    `coefs` holds the coefficients in SCORE_REASONS order, shape (10,) for one
+    profile or (N, 10) for N profiles with (N, days) rule arrays.
+    """
+    # Precipitation replaces a neutral day outright, otherwise only when it scores no higher
+    override = (precipitation != 0) & (
+        (primary == 0)
+        | (np.take_along_axis(coefs, precipitation, axis=-1) <= np.take_along_axis(coefs, primary, axis=-1))
+    )
+    return np.where(override, precipitation, primary)
 
-def get_forecasted_data(lat, long, city_timezone, city, state, model, col_names=None, save_csv=True):
-    if col_names is None:
-        col_names = ["temperature_2m_max", "wind_speed_10m_mean", "dew_point_2m_min", "rain_sum", "cloud_cover_mean", "snowfall_sum"]
-    
-    # Check cache first
-    cache_filename = get_cache_filename("forecasted", city, state, model)
-    cached_df = load_cached_data(cache_filename)
-    if cached_df is not None:
-        print(f"Loading forecasted data from cache: {cache_filename}")
-        return cached_df, cache_filename
-    
-    print(f"Fetching forecasted data for {city}, {state} with model {model} from API...")
-    openmeteo = openmeteo_requests.Client()
-    url = "https://climate-api.open-meteo.com/v1/climate"
-    params = {
-        "latitude": lat,
-        "longitude": long,
-        "start_date": date.today(),
-        "end_date": date(date.today().year + 24, 12, 31),
-        "models": model,
-        "daily": col_names
-    }
-    responses = openmeteo.weather_api(url, params=params)
-    df_single_model = extract_data_from_api_response(responses[0].Daily(), col_names, hourly=False, timezone=city_timezone)
-    df_single_model.columns = [
-        col if col == 'date' else col + f'__{model}'
-        for col in df_single_model.columns
-    ]
-    
-    # Save to cache
-    if save_csv:
-        save_cached_data(df_single_model, cache_filename)
-    else:   
-        cache_filename = None
-    return df_single_model, cache_filename
 
+# Rule firings of a day as one code: the primary rule (0-6) plus 7 times the precipitation
+# slot (0 none, 1 light rain, 2 heavy rain, 3 snow). These arrays give the (primary,
+# precipitation) pair of every firing code.
+FIRING_PRIMARY = np.tile(np.arange(7, dtype=np.uint8), 4)
+FIRING_PRECIPITATION = np.repeat(np.array([0, 7, 8, 9], dtype=np.uint8), 7)
 
-def process_historical_for_plotting(df, climate_score, city=None, state=None):
-    # Check cache first if city and state are provided
-    if city and state:
-        score_params = climate_score.get_all_parameters()
-        cache_filename = get_cache_filename("historical_score", city, state, score_params=score_params)
-        cached_df = load_cached_data(cache_filename)
-        if cached_df is not None:
-            print(f"Loading historical score data from cache: {cache_filename}")
-            # Extract reasons from the cached data (assuming they're stored in a separate column or we can reconstruct them)
-            reasons = cached_df["reason"].tolist() if "reason" in cached_df.columns else []
-            return cached_df, reasons
-
-    print("Processing historical daily data for plotting...")
-    df["date"] = df["date"].astype(str)
-    scores = []
-    reasons = []
-    for idx, row in df.iterrows():
-        # Use daily scoring function
-        score, reason = daily_climate_score__daily(
-            row["temperature_2m_max__celsius"],
-            row["dew_point_2m_min__celsius"],
-            row["wind_speed_10m_mean__kilometres_per_hour"],
-            row["cloud_cover_mean__percentage"],
-            row["rain_sum__millimetre"],
-            row["snowfall_sum__centimetre"],
-            climate_score.scaling_factor,
-            climate_score
-        )
-        scores.append((row["date"], score, reason))
-        reasons.append(reason)
-    score_df = pd.DataFrame(scores, columns=["date", "score", "reason"])
-    score_df["date"] = pd.to_datetime(score_df["date"])
-    score_df["year"] = score_df["date"].dt.year
 
-    # Save to cache if city and state are provided
-    if city and state:
-        score_params = climate_score.get_all_parameters()
-        cache_filename = get_cache_filename("historical_score", city, state, score_params=score_params)
-        save_cached_data(score_df, cache_filename)
+def _firing_codes(primary, precipitation):
+    """Combine the primary and precipitation rule arrays of _rule_firings into firing codes."""
+    return (primary + 7 * np.where(precipitation == 0, 0, precipitation - 6)).astype(np.uint8)
 
-    return score_df, reasons
 
+def outcome_lookup(score_obj):
+    """
+    Lookup table from firing codes (see daily_firings__vectorized) to outcome
+    codes under a Score's coefficients.
 
-def process_forecasted_for_plotting(df, climate_score, model="NICAM16_8S", city=None, state=None):
-    # Check cache first if city and state are provided
-    if city and state: 
-        score_params = climate_score.get_all_parameters()
-        cache_filename = get_cache_filename("forecasted_score", city, state, model, score_params)
-        cached_df = load_cached_data(cache_filename)
-        if cached_df is not None:
-            print(f"Loading forecasted score data from cache: {cache_filename}")
-            # Extract reasons from the cached data
-            reasons = cached_df["reason"].tolist() if "reason" in cached_df.columns else []
-            return cached_df, reasons
-    
-    print(f"Processing forecasted data for plotting with model {model}...")
-    df["date"] = df["date"].astype(str)
-    scores_forecasted = []
-    reasons_forecasted = []
-    for index, row in df.iterrows():
-        date_val = row['date']
-        score, reason = daily_climate_score__daily(
-            row[f'temperature_2m_max__celsius__{model}'],
-            row[f'dew_point_2m_min__celsius__{model}'],
-            row[f'wind_speed_10m_mean__kilometres_per_hour__{model}'],
-            row[f'cloud_cover_mean__percentage__{model}'],
-            row[f'rain_sum__millimetre__{model}'],
-            row[f'snowfall_sum__centimetre__{model}'],
-            climate_score.scaling_factor,
-            climate_score)
-        scores_forecasted.append((date_val, score, reason))
-        reasons_forecasted.append(reason)
-    score_df_forecasted = pd.DataFrame(scores_forecasted, columns=["date", "score", "reason"])
-    score_df_forecasted["date"] = pd.to_datetime(score_df_forecasted["date"])
-    score_df_forecasted["year"] = score_df_forecasted["date"].dt.year
-    
-    # Save to cache if city and state are provided
-    if city and state:
-        score_params = climate_score.get_all_parameters()
-        cache_filename = get_cache_filename("forecasted_score", city, state, model, score_params)
-        save_cached_data(score_df_forecasted, cache_filename)
-    
-    return score_df_forecasted, reasons_forecasted
+    Returns:
+        uint8 array with the outcome code of each firing code
+    """
+    coefs = np.array(score_obj.compile().coefs)
+    return _resolve_outcomes(FIRING_PRIMARY, FIRING_PRECIPITATION, coefs).astype(np.uint8, copy=False)
 
 
-def get_combined_forecasted_data(lat, long, city_timezone, city, state, models=None, col_names=None, save_csv=True):
+def outcome_tables(score_obj):
     """
-    Fetch forecasted data for multiple models and return a combined dataframe.
-    
-    Args:
-        lat, long: coordinates
-        city_timezone: timezone string
-        city, state: location identifiers
-        models: list of model names to fetch data for
-        col_names: list of column names to fetch
-        save_csv: whether to save to cache
-    
+    Lookup tables from outcome codes (the index into SCORE_REASONS of the rule
+    that decides a day) to the day's score and reason for a Score.
+
     Returns:
-        combined_df: DataFrame with date/year columns and model-specific score/reason columns
-        cache_filename: cache filename if saved, None otherwise
+        scores: int8 array with the score (0-100) of each code
+        reasons: object array with the reason of each code
     """
-    if models is None:
-        models = ["EC_Earth3P_HR", "MRI_AGCM3_2_S", "NICAM16_8S"]
-    if col_names is None:
-        col_names = ["temperature_2m_max", "wind_speed_10m_mean", "dew_point_2m_min", "rain_sum", "cloud_cover_mean", "snowfall_sum"]
-    
-    # Check cache first
-    cache_filename = get_cache_filename("combined_forecasted", city, state, models=models)
-    cached_df = load_cached_data(cache_filename)
-    if cached_df is not None:
-        print(f"Loading combined forecasted data from cache: {cache_filename}")
-        return cached_df, cache_filename
-    
-    print(f"Fetching combined forecasted data for {city}, {state} with models {models} from API...")
-    openmeteo = openmeteo_requests.Client()
-    
-    # Fetch data for each model
-    model_dataframes = {}
-    for model in models:
-        url = "https://climate-api.open-meteo.com/v1/climate"
-        params = {
-            "latitude": lat,
-            "longitude": long,
-            "start_date": date.today(),
-            "end_date": date(date.today().year + 24, 12, 31),
-            "models": model,
-            "daily": col_names
-        }
-        responses = openmeteo.weather_api(url, params=params)
-        df_model = extract_data_from_api_response(responses[0].Daily(), col_names, hourly=False, timezone=city_timezone)
-        
-        # Add model suffix to column names (except date)
-        df_model.columns = [
-            col if col == 'date' else col + f'__{model}'
-            for col in df_model.columns
-        ]
-        model_dataframes[model] = df_model
-    
-    # Combine all model dataframes on date
-    combined_df = model_dataframes[models[0]].copy()
-    for model in models[1:]:
-        combined_df = pd.merge(combined_df, model_dataframes[model], on='date', how='outer')
-    
-    # Add year column
-    combined_df['year'] = pd.to_datetime(combined_df['date']).dt.year
-    
-    # Save to cache
-    if save_csv:
-        save_cached_data(combined_df, cache_filename)
-    else:   
-        cache_filename = None
-    
-    return combined_df, cache_filename
+    coefs = np.array(score_obj.compile().coefs)
+    return ((coefs + 2) * 25).astype(np.int8), np.array(SCORE_REASONS, dtype=object)
 
 
-def process_combined_forecasted_for_plotting(df, climate_score, models=None, city=None, state=None):
+def daily_firings__vectorized(temperature_max,
+                              dew_point_min,
+                              wind_mean,
+                              cloud_cover_mean,
+                              rain_sum,
+                              snowfall_sum,
+                              scaling_factor,
+                              score_obj):
     """
-    Process combined forecasted data for plotting, generating scores for all models.
-    
-    Args:
-        df: combined forecasted dataframe with model-specific columns
-        climate_score: Score object with preferences
-        models: list of model names
-        city, state: location identifiers for caching
-    
+    Find the rules that fire on every day, as firing codes.
+
+    Takes one array per weather variable (one entry per day). The codes depend on
+    the thresholds and scaling factor of score_obj only, never on its coefficients,
+    so they can be computed once and scored for any coefficients with outcome_lookup.
+
     Returns:
-        processed_df: DataFrame with date, year, and model-specific score/reason columns
-        all_reasons: list of all unique reasons across all models
+        uint8 array of firing codes
     """
-    if models is None:
-        models = ["EC_Earth3P_HR", "MRI_AGCM3_2_S", "NICAM16_8S"]
-    
-    # Check cache first if city and state are provided
-    if city and state:
-        score_params = climate_score.get_all_parameters()
-        cache_filename = get_cache_filename("combined_forecasted_score", city, state, models=models, score_params=score_params)
-        cached_df = load_cached_data(cache_filename)
-        if cached_df is not None:
-            print(f"Loading combined forecasted score data from cache: {cache_filename}")
-            # Extract reasons from the cached data
-            all_reasons = []
-            for model in models:
-                reason_col = f'reason_{model}'
-                if reason_col in cached_df.columns:
-                    all_reasons.extend(cached_df[reason_col].dropna().unique().tolist())
-            all_reasons = list(set(all_reasons))
-            return cached_df, all_reasons
-    
-    print(f"Processing combined forecasted data for plotting with models {models}...")
-    
-    # Initialize result dataframe with date and year
-    result_df = df[['date', 'year']].copy()
-    all_reasons = []
-    
-    # Process each model
-    for model in models:
-        scores_model = []
-        reasons_model = []
-        
-        for idx, row in df.iterrows():
-            # Use daily scoring function for each model
-            score, reason = daily_climate_score__daily(
-                row[f'temperature_2m_max__celsius__{model}'],
-                row[f'dew_point_2m_min__celsius__{model}'],
-                row[f'wind_speed_10m_mean__kilometres_per_hour__{model}'],
-                row[f'cloud_cover_mean__percentage__{model}'],
-                row[f'rain_sum__millimetre__{model}'],
-                row[f'snowfall_sum__centimetre__{model}'],
-                climate_score.scaling_factor,
-                climate_score
-            )
-            scores_model.append(score)
-            reasons_model.append(reason)
-            all_reasons.append(reason)
-        
-        # Add model-specific columns
-        result_df[f'score_{model}'] = scores_model
-        result_df[f'reason_{model}'] = reasons_model
-    
-    # Remove duplicates from all_reasons
-    all_reasons = list(set(all_reasons))
-    
-    # Save to cache if city and state are provided
-    if city and state:
-        score_params = climate_score.get_all_parameters()
-        cache_filename = get_cache_filename("combined_forecasted_score", city, state, models=models, score_params=score_params)
-        save_cached_data(result_df, cache_filename)
-    
-    return result_df, all_reasons
+    # Compare in float64 like the per-row path, which sees Python floats
+    primary, precipitation = _rule_firings(
+        np.asarray(temperature_max, dtype=np.float64),
+        np.asarray(dew_point_min, dtype=np.float64),
+        np.asarray(wind_mean, dtype=np.float64),
+        np.asarray(cloud_cover_mean, dtype=np.float64),
+        np.asarray(rain_sum, dtype=np.float64),
+        np.asarray(snowfall_sum, dtype=np.float64),
+        scaling_factor,
+        score_obj.compile()
+    )
+    return _firing_codes(primary, precipitation)
 
 
-def get_cache_filename(data_type, city, state, model=None, score_params=None, models=None):
+def daily_outcomes__vectorized(temperature_max,
+                               dew_point_min,
+                               wind_mean,
+                               cloud_cover_mean,
+                               rain_sum,
+                               snowfall_sum,
+                               scaling_factor,
+                               score_obj):
     """
-    Generate cache filename based on data type and parameters.
-    
-    Args:
-        data_type: 'historical_hourly', 'forecasted', 'historical_score', 'forecasted_score', 'historical_daily', 'historical_pm25', 'combined_forecasted', 'combined_forecasted_score'
-        city: city name
-        state: state name
-        model: model name (for forecasted data)
-        score_params: score parameters dict (for score data)
-        models: list of model names (for combined forecasted data)
-    
+    Whole-array version of daily_climate_score__daily, returning outcome codes.
+
+    Takes one array per weather variable (one entry per day) and returns the
+    outcome code of every day in a single pass. The rule masks are resolved in
+    the same priority order as the per-day function (humid, dry heat, cold windy,
+    cold still, ideal, then precipitation overrides), so the scores and reasons
+    the codes map to through outcome_tables are identical.
+
     Returns:
-        cache filename string
+        uint8 array of outcome codes (indices into SCORE_REASONS)
     """
-    # Create cache directory if it doesn't exist
-    cache_dir = "cache"
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
-    
-    if data_type == "historical_hourly":
-        return os.path.join(cache_dir, f"{city}_{state}_historical_hourly.csv")
-    elif data_type == "historical_daily":
-        return os.path.join(cache_dir, f"{city}_{state}_historical_daily.csv")
-    elif data_type == "historical_pm25":
-        return os.path.join(cache_dir, f"{city}_{state}_historical_pm25.csv")
-    elif data_type == "forecasted":
-        return os.path.join(cache_dir, f"{city}_{state}_{model}_forecasted_data.csv")
-    elif data_type == "historical_score":
-        # Create hash of score parameters for filename
-        score_hash = hashlib.md5(json.dumps(score_params, sort_keys=True).encode()).hexdigest()[:8]
-        return os.path.join(cache_dir, f"{city}_{state}_historical_score_{score_hash}.csv")
-    elif data_type == "forecasted_score":
-        # Create hash of score parameters for filename
-        score_hash = hashlib.md5(json.dumps(score_params, sort_keys=True).encode()).hexdigest()[:8]
-        return os.path.join(cache_dir, f"{city}_{state}_{model}_forecasted_score_{score_hash}.csv")
-    elif data_type == "combined_forecasted":
-        models_str = '_'.join(models) if models else 'all_models'
-        return os.path.join(cache_dir, f"{city}_{state}_{models_str}_combined_forecasted_data.csv")
-    elif data_type == "combined_forecasted_score":
-        # Create hash of score parameters for filename
-        score_hash = hashlib.md5(json.dumps(score_params, sort_keys=True).encode()).hexdigest()[:8]
-        models_str = '_'.join(models) if models else 'all_models'
-        return os.path.join(cache_dir, f"{city}_{state}_{models_str}_combined_forecasted_score_{score_hash}.csv")
-    else:
-        raise ValueError(f"Unknown data_type: {data_type}")
+    firings = daily_firings__vectorized(
+        temperature_max, dew_point_min, wind_mean, cloud_cover_mean, rain_sum, snowfall_sum, scaling_factor, score_obj
+    )
+    return outcome_lookup(score_obj)[firings]
 
 
-def get_cache_directory_file():
+def daily_climate_score__vectorized(temperature_max,
+                                    dew_point_min,
+                                    wind_mean,
+                                    cloud_cover_mean,
+                                    rain_sum,
+                                    snowfall_sum,
+                                    scaling_factor,
+                                    score_obj):
     """
-    Get the path to the cache directory file.
-    
+    Whole-array version of daily_climate_score__daily: the outcome codes of
+    daily_outcomes__vectorized mapped to scores and reasons.
+
     Returns:
-        Path to the cache directory file
+        scores: int8 array of scores (0-100)
+        reasons: object array of reason strings
     """
-    cache_dir = "cache"
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
-    return os.path.join(cache_dir, "cache_directory.json")
+    outcome = daily_outcomes__vectorized(
+        temperature_max, dew_point_min, wind_mean, cloud_cover_mean, rain_sum, snowfall_sum, scaling_factor, score_obj
+    )
+    score_table, reason_table = outcome_tables(score_obj)
+    return score_table[outcome], reason_table[outcome]
 
 
-def load_cache_directory():
+def _weather_columns(df, suffix=""):
+    """Pull the six scoring columns out of a daily weather dataframe as float64 arrays."""
+    return [
+        df[f"{col}{suffix}"].to_numpy(dtype=np.float64)
+        for col in (
+            "temperature_2m_max__celsius",
+            "dew_point_2m_min__celsius",
+            "wind_speed_10m_mean__kilometres_per_hour",
+            "cloud_cover_mean__percentage",
+            "rain_sum__millimetre",
+            "snowfall_sum__centimetre",
+        )
+    ]
+
+
+def score_weather_frame(df, climate_score, suffix=""):
     """
-    Load the cache directory information from file.
-    
+    Score every day of a daily weather dataframe with the vectorized scoring engine.
+
+    Args:
+        df: daily weather dataframe (historical or forecasted)
+        climate_score: Score object with preferences
+        suffix: column suffix, e.g. '__EC_Earth3P_HR' for model-specific forecast columns
+
     Returns:
-        Dictionary containing cache file information
+        uint8 array of outcome codes aligned with the rows of df (see outcome_tables)
     """
-    directory_file = get_cache_directory_file()
-    if os.path.exists(directory_file):
-        try:
-            with open(directory_file, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading cache directory: {e}")
-            return {}
-    return {}
+    return outcome_lookup(climate_score)[weather_frame_firings(df, climate_score, suffix)]
 
 
-def save_cache_directory(cache_info):
+def weather_frame_firings(df, climate_score, suffix=""):
     """
-    Save the cache directory information to file.
-    
+    Find the rules firing on every day of a daily weather dataframe.
+
     Args:
-        cache_info: Dictionary containing cache file information
+        df: daily weather dataframe (historical or forecasted)
+        climate_score: Score object; only its thresholds and time window are used
+        suffix: column suffix, e.g. '__EC_Earth3P_HR' for model-specific forecast columns
+
+    Returns:
+        uint8 array of firing codes aligned with the rows of df (see outcome_lookup)
     """
-    directory_file = get_cache_directory_file()
-    try:
-        with open(directory_file, 'w') as f:
-            json.dump(cache_info, f, indent=2)
-    except Exception as e:
-        print(f"Error saving cache directory: {e}")
+    return daily_firings__vectorized(
+        *_weather_columns(df, suffix),
+        climate_score.scaling_factor,
+        climate_score
+    )
 
 
-def update_cache_access_info(filename):
+def apply_coefficients(firing_df, climate_score):
     """
-    Update the access information for a cache file.
-    Increments access count and updates last access time.
-    
+    Score a frame of cached rule firings: every `firing` / `firing_{model}` column
+    is replaced by the `outcome` / `outcome_{model}` codes it maps to under the
+    coefficients of climate_score. Only a table lookup, the weather is not needed.
+
     Args:
-        filename: Path to the cache file
+        firing_df: frame with firing columns
+        climate_score: Score object with preferences
+
+    Returns:
+        DataFrame with the outcome columns in place of the firing columns
     """
-    cache_info = load_cache_directory()
-    current_time = time.time()
-    
-    if filename in cache_info:
-        # Increment access count and update last access time
-        cache_info[filename]['access_count'] = cache_info[filename].get('access_count', 0) + 1
-        cache_info[filename]['last_accessed'] = current_time
-    else:
-        # If file doesn't exist in directory, get its size
-        file_size = 0
-        if os.path.exists(filename):
-            try:
-                file_size = os.path.getsize(filename)
-            except OSError:
-                file_size = 0
-        
-        cache_info[filename] = {
-            'last_accessed': current_time,
-            'size_bytes': file_size,
-            'access_count': 1  # Initialize access count to 1 for new files
-        }
-    
-    save_cache_directory(cache_info)
+    lookup = outcome_lookup(climate_score)
+    firing_cols = [col for col in firing_df.columns if col == 'firing' or col.startswith('firing_')]
+    outcomes = {'outcome' + col[len('firing'):]: lookup[firing_df[col].to_numpy()] for col in firing_cols}
+    return firing_df.drop(columns=firing_cols).assign(**outcomes)
 
 
-def get_cache_file_size(filename):
+def score_profiles_batch(df, climate_scores, suffix=""):
     """
-    Get the size of a cache file in bytes.
-    
-    Args:
+    Score one city's daily weather against many Score profiles at once.
+
+    The weather columns are read and converted once. Profiles that share the
+    same thresholds share one pass over the days; their coefficients are then
+    applied through a small per-profile lookup table, so adding a profile costs
+    little more than writing its row of the output.
+
+    Args:
+        df: daily weather dataframe (historical or forecasted)
+        climate_scores: list of Score (or ScoreRules) objects
+        suffix: column suffix, e.g. '__EC_Earth3P_HR' for model-specific forecast columns
+
+    Returns:
+        score_matrix: (N_profiles x N_days) int array
+        reason_matrix: (N_profiles x N_days) object array of reason strings
+    """
+    columns = _weather_columns(df, suffix)
+    all_rules = [climate_score.compile() for climate_score in climate_scores]
+    reason_names = np.array(SCORE_REASONS, dtype=object)
+
+    # Group profiles by their thresholds; coefficients don't change which rules fire
+    groups = {}
+    for i, rules in enumerate(all_rules):
+        groups.setdefault(replace(rules, **{name: 0 for name in _COEF_FIELDS}), []).append(i)
+
+    score_matrix = np.empty((len(all_rules), len(df)), dtype=np.int64)
+    reason_matrix = np.empty((len(all_rules), len(df)), dtype=object)
+    for thresholds, members in groups.items():
+        firings = _firing_codes(*_rule_firings(*columns, thresholds.scaling_factor, thresholds))
+
+        coefs = np.array([all_rules[i].coefs for i in members])
+        grid_shape = (len(members), len(FIRING_PRIMARY))
+        lookup = _resolve_outcomes(
+            np.broadcast_to(FIRING_PRIMARY, grid_shape),
+            np.broadcast_to(FIRING_PRECIPITATION, grid_shape),
+            coefs
+        )
+        outcome = lookup[:, firings]
+        score_matrix[members] = (np.take_along_axis(coefs, outcome, axis=-1) + 2) * 25
+        reason_matrix[members] = reason_names[outcome]
+    return score_matrix, reason_matrix
+
+
+####### Shared HTTP session for all API calls
+# Pool size, timeouts and retries can be tuned through environment variables,
+# read when the session is first created (after app.py has loaded .env)
+HTTP_DEFAULTS = {
+    'HTTP_POOL_SIZE': 10,
+    'HTTP_CONNECT_TIMEOUT': 10,
+    'HTTP_READ_TIMEOUT': 120,
+    'HTTP_MAX_RETRIES': 3,
+    'HTTP_BACKOFF_FACTOR': 1,
+}
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_http_stats = {'requests': 0, 'new_connections': 0, 'retries': 0}
+_http_stats_lock = threading.Lock()
+_http_session = None
+_openmeteo_client = None
+_http_client_lock = threading.Lock()
+# Optional cap on the API request rate (see set_api_rate_limit)
+_api_rate_limiter = None
+
+
+def _count_http(name, amount=1):
+    with _http_stats_lock:
+        _http_stats[name] += amount
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self, *args, **kwargs):
+        _count_http('new_connections')
+        return super()._new_conn(*args, **kwargs)
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self, *args, **kwargs):
+        _count_http('new_connections')
+        return super()._new_conn(*args, **kwargs)
+
+
+class _CountingRetry(Retry):
+    def increment(self, *args, **kwargs):
+        _count_http('retries')
+        return super().increment(*args, **kwargs)
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rate` calls per second on average, in bursts of up to `burst`."""
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a call is allowed."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def set_api_rate_limit(requests_per_second, burst=1):
+    """
+    Cap the rate of requests sent through the shared HTTP session (retries excluded).
+    
+    Args:
+        requests_per_second: average request rate allowed; None or 0 removes the limit
+        burst: number of requests that may be sent back to back
+    """
+    global _api_rate_limiter
+    _api_rate_limiter = RateLimiter(requests_per_second, burst) if requests_per_second else None
+
+
+class _PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter with keep-alive pools, a default timeout and request/connection counters."""
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+    
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        if _api_rate_limiter is not None:
+            _api_rate_limiter.acquire()
+        _count_http('requests')
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+def get_http_session():
+    """
+    Get the shared requests session used for every API call.
+    Connections are kept alive and pooled per host (HTTP_POOL_SIZE), requests
+    time out after HTTP_CONNECT_TIMEOUT/HTTP_READ_TIMEOUT seconds, and 429/5xx
+    responses are retried up to HTTP_MAX_RETRIES times with exponential backoff
+    (HTTP_BACKOFF_FACTOR, honouring Retry-After).
+    
+    Returns:
+        requests.Session
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_client_lock:
+            if _http_session is None:
+                settings = {name: float(os.getenv(name, default)) for name, default in HTTP_DEFAULTS.items()}
+                pool_size = int(settings['HTTP_POOL_SIZE'])
+                retry = _CountingRetry(
+                    total=int(settings['HTTP_MAX_RETRIES']),
+                    backoff_factor=settings['HTTP_BACKOFF_FACTOR'],
+                    status_forcelist=RETRY_STATUS_CODES,
+                    allowed_methods=frozenset(['GET', 'POST']),
+                    respect_retry_after_header=True,
+                    raise_on_status=False
+                )
+                adapter = _PooledHTTPAdapter(
+                    timeout=(settings['HTTP_CONNECT_TIMEOUT'], settings['HTTP_READ_TIMEOUT']),
+                    pool_connections=pool_size,
+                    pool_maxsize=pool_size,
+                    max_retries=retry
+                )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_session = session
+    return _http_session
+
+
+def get_openmeteo_client():
+    """
+    Get the shared Open-Meteo client, which sends its requests through get_http_session().
+    
+    Returns:
+        openmeteo_requests.Client
+    """
+    global _openmeteo_client
+    if _openmeteo_client is None:
+        session = get_http_session()
+        with _http_client_lock:
+            if _openmeteo_client is None:
+                _openmeteo_client = openmeteo_requests.Client(session=session)
+    return _openmeteo_client
+
+
+def get_http_stats():
+    """
+    Get the HTTP counters of the shared session.
+    
+    Returns:
+        Dictionary with the number of requests sent, new connections opened,
+        connections reused and retries performed
+    """
+    with _http_stats_lock:
+        stats = dict(_http_stats)
+    stats['reused_connections'] = max(0, stats['requests'] - stats['new_connections'])
+    return stats
+
+
+def reset_http_stats():
+    """Reset the HTTP counters to zero."""
+    with _http_stats_lock:
+        for name in _http_stats:
+            _http_stats[name] = 0
+
+
+def normalize_place_name(name):
+    """Normalize a city or state name for geocode lookups (case, surrounding and repeated whitespace)."""
+    return " ".join(str(name).split()).casefold()
+
+
+_geocode_bootstrap_lock = threading.Lock()
+_geocode_bootstrapped = False
+
+
+def import_geocode_table(path):
+    """
+    Load an offline table of US places into the persistent geocode cache.
+    Existing entries are kept.
+    
+    Args:
+        path: CSV file with city, state, latitude, longitude, timezone and population columns
+    
+    Returns:
+        Number of rows read from the table
+    """
+    places = pd.read_csv(path)
+    rows = [
+        (
+            normalize_place_name(place.city), normalize_place_name(place.state),
+            float(place.latitude), float(place.longitude), place.timezone,
+            None if pd.isna(place.population) else int(place.population)
+        )
+        for place in places.itertuples(index=False)
+    ]
+    get_cache_db().executemany(
+        """INSERT OR IGNORE INTO geocode (city_key, state_key, latitude, longitude, timezone, population)
+        VALUES (?, ?, ?, ?, ?, ?)""",
+        rows
+    )
+    return len(rows)
+
+
+def _bootstrap_geocode_cache():
+    """Import the table named by GEOCODE_BOOTSTRAP_FILE once per process, if set."""
+    global _geocode_bootstrapped
+    if _geocode_bootstrapped:
+        return
+    with _geocode_bootstrap_lock:
+        if _geocode_bootstrapped:
+            return
+        path = os.getenv('GEOCODE_BOOTSTRAP_FILE')
+        if path:
+            try:
+                print(f"Loaded {import_geocode_table(path)} places into the geocode cache from {path}")
+            except Exception as e:
+                print(f"Error loading geocode bootstrap table {path}: {e}")
+        _geocode_bootstrapped = True
+
+
+@lru_cache(maxsize=1024)
+def _lookup_city_info(city_key, state_key):
+    """Resolve a normalized (city, state) through the persistent geocode cache, then the geocoding API."""
+    _bootstrap_geocode_cache()
+    conn = get_cache_db()
+    row = conn.execute(
+        "SELECT latitude, longitude, timezone, population FROM geocode WHERE city_key = ? AND state_key = ?",
+        (city_key, state_key)
+    ).fetchone()
+    if row is not None:
+        return row
+    
+    url = 'https://geocoding-api.open-meteo.com/v1/search'
+    response = get_http_session().get(url, params={'name': city_key, 'count': 100, 'countryCode': 'US'})
+    data = response.json()
+    filtered_data = [
+        item for item in data.get('results', [])
+        if item['country_code'] == 'US' and normalize_place_name(item.get('admin1', '')) == state_key
+    ]
+    if not filtered_data:
+        raise ValueError(f"No results found for {city_key}, {state_key}")
+    info = filtered_data[0]
+    row = (info['latitude'], info['longitude'], info['timezone'], info.get('population', None))
+    conn.execute(
+        """INSERT OR REPLACE INTO geocode (city_key, state_key, latitude, longitude, timezone, population)
+        VALUES (?, ?, ?, ?, ?, ?)""",
+        (city_key, state_key) + row
+    )
+    return row
+
+
+def get_city_info(city, state):
+    """
+    Get the location of a US city. Results are remembered in memory and in the
+    cache database, so the geocoding API is only called for new places.
+    
+    Args:
+        city: city name
+        state: full state name, e.g. 'Oregon'
+    
+    Returns:
+        latitude, longitude, timezone, population (None if unknown)
+    """
+    try:
+        return _lookup_city_info(normalize_place_name(city), normalize_place_name(state))
+    except ValueError:
+        raise ValueError(f"No results found for {city}, {state}")
+
+
+def get_historical_window_start():
+    """First day of the rolling 10-year historical window."""
+    return date(date.today().year - 10, 1, 2)
+
+
+def update_historical_daily_data(lat, long, city, state, col_names, cache_filename, save_csv=True):
+    """
+    Load the cached historical daily weather and bring it up to date.
+    
+    Only the missing tail is requested from the archive API: everything after
+    the last day whose values are all present (the archive fills in recent days
+    with a delay). The new rows replace that tail and days that have fallen out
+    of the rolling 10-year window are dropped.
+    
+    Args:
+        lat, long: coordinates
+        city, state: location identifiers
+        col_names: list of daily variables to fetch
+        cache_filename: historical_daily cache file
+        save_csv: whether to save the refreshed data to the cache
+    
+    Returns:
+        DataFrame with the historical daily weather
+    """
+    today = date.today()
+    window_start = get_historical_window_start()
+    cached_weather = load_cached_data(cache_filename, "historical_daily")
+    
+    fetch_start = window_start
+    if cached_weather is not None:
+        cached_dates = pd.to_datetime(cached_weather['date'])
+        if not cached_dates.empty and cached_dates.max().date() >= today:
+            print(f"Loading historical daily weather from cache: {cache_filename}")
+            return cached_weather
+        value_cols = [col for col in cached_weather.columns if col not in ('date', 'datetime')]
+        complete_dates = cached_dates[cached_weather[value_cols].notna().all(axis=1)]
+        if not complete_dates.empty:
+            fetch_start = max(window_start, complete_dates.max().date() + dt.timedelta(days=1))
+    
+    print(f"Fetching historical daily weather for {city}, {state} from {fetch_start} to {today} from API...")
+    openmeteo = get_openmeteo_client()
+    url = "https://archive-api.open-meteo.com/v1/archive"
+    params = {
+        "latitude": lat,
+        "longitude": long,
+        "start_date": fetch_start,
+        "end_date": today,
+        "daily": col_names,
+        "timezone": 'GMT'
+    }
+    responses = openmeteo.weather_api(url, params=params)
+    df_historical_weather = extract_data_from_api_response(responses[0].Daily(), col_names, hourly=False)
+    
+    if cached_weather is not None and fetch_start > window_start:
+        # Keep the cached days still inside the window and before the refreshed tail
+        cached_days = cached_dates.dt.date
+        kept = cached_weather[((cached_days >= window_start) & (cached_days < fetch_start)).to_numpy()]
+        df_historical_weather = pd.concat([kept, df_historical_weather[kept.columns]], ignore_index=True)
+    df_historical_weather = apply_frame_schema(df_historical_weather, "historical_daily")
+    
+    if save_csv:
+        save_cached_data(df_historical_weather, cache_filename)
+    return df_historical_weather
+
+
+# Hourly archive variables, in the order of the daily scoring columns (see _weather_columns)
+HOURLY_COLUMNS = ["temperature_2m", "dew_point_2m", "wind_speed_10m", "cloud_cover", "rain", "snowfall"]
+HOURLY_STORE_EXTENSION = '.npz'
+
+
+def get_historical_resolution():
+    """
+    Resolution the historical weather is scored at (HISTORICAL_RESOLUTION env var):
+    'daily' (default) scores the daily archive values, 'hourly' scores each day on
+    the hours inside the preferred time window. Forecasts are only available daily.
+    """
+    resolution = os.getenv('HISTORICAL_RESOLUTION', 'daily').lower()
+    if resolution not in ('daily', 'hourly'):
+        raise ValueError(f"HISTORICAL_RESOLUTION must be 'daily' or 'hourly', got {resolution}")
+    return resolution
+
+
+def _fetch_hourly_chunk(lat, long, start_date, end_date):
+    """
+    Fetch the HOURLY_COLUMNS (UTC hours) for a date range from the archive API.
+    
+    Returns:
+        unix seconds of the first hour, float32 array of shape (len(HOURLY_COLUMNS), hours)
+    """
+    openmeteo = get_openmeteo_client()
+    url = "https://archive-api.open-meteo.com/v1/archive"
+    params = {
+        "latitude": lat,
+        "longitude": long,
+        "start_date": start_date,
+        "end_date": end_date,
+        "hourly": HOURLY_COLUMNS,
+        "timezone": 'GMT'
+    }
+    hourly = openmeteo.weather_api(url, params=params)[0].Hourly()
+    values = np.stack([hourly.Variables(i).ValuesAsNumpy() for i in range(len(HOURLY_COLUMNS))])
+    return hourly.Time(), values.astype(np.float32, copy=False)
+
+
+def update_historical_hourly_store(lat, long, city, state, cache_filename, save_csv=True):
+    """
+    Load the cached hourly historical weather and bring it up to date.
+    
+    The store holds the HOURLY_COLUMNS as one float32 array of shape
+    (variables, hours) on an implicit UTC hourly index from `start`, covering
+    the rolling 10-year window through the end of today. As for the daily data,
+    only the days from the first incomplete hour on are requested, one calendar
+    year per request, and hours that have left the window are dropped.
+    
+    Args:
+        lat, long: coordinates
+        city, state: location identifiers
+        cache_filename: historical_hourly cache file
+        save_csv: whether to save the refreshed store to the cache
+    
+    Returns:
+        dict with start (unix seconds), interval (seconds), values and
+        fetched (ordinal of the day it was last refreshed)
+    """
+    today = date.today()
+    window_start = get_historical_window_start()
+    cached = load_cached_arrays(cache_filename)
+    if cached is not None and int(cached['fetched']) >= today.toordinal():
+        print(f"Loading historical hourly weather from cache: {cache_filename}")
+        return cached
+    
+    interval = 3600
+    start = int(pd.Timestamp(window_start, tz='UTC').timestamp())
+    end = int(pd.Timestamp(today + dt.timedelta(days=1), tz='UTC').timestamp())
+    values = np.full((len(HOURLY_COLUMNS), (end - start) // interval), np.nan, dtype=np.float32)
+    
+    fetch_start = window_start
+    if cached is not None:
+        # Keep the cached hours still inside the window
+        offset = (int(cached['start']) - start) // interval
+        cached_values = cached['values']
+        src, dst = max(0, -offset), max(0, offset)
+        n = min(cached_values.shape[1] - src, values.shape[1] - dst)
+        if n > 0:
+            values[:, dst:dst + n] = cached_values[:, src:src + n]
+        complete = np.isfinite(values).all(axis=0)
+        first_incomplete = int(np.argmin(complete)) if not complete.all() else len(complete) - 1
+        fetch_start = max(window_start, pd.Timestamp(start + first_incomplete * interval, unit='s').date())
+    
+    print(f"Fetching historical hourly weather for {city}, {state} from {fetch_start} to {today} from API...")
+    chunks = [
+        (max(fetch_start, date(year, 1, 1)), min(today, date(year, 12, 31)))
+        for year in range(fetch_start.year, today.year + 1)
+    ]
+    with ThreadPoolExecutor(max_workers=min(4, len(chunks))) as executor:
+        for chunk_start, chunk_values in executor.map(lambda chunk: _fetch_hourly_chunk(lat, long, *chunk), chunks):
+            offset = (int(chunk_start) - start) // interval
+            n = min(chunk_values.shape[1], values.shape[1] - offset)
+            values[:, offset:offset + n] = chunk_values[:, :n]
+    
+    store = {
+        'start': np.int64(start),
+        'interval': np.int64(interval),
+        'values': values,
+        'fetched': np.int64(today.toordinal()),
+    }
+    if save_csv:
+        save_cached_arrays(store, cache_filename)
+    return store
+
+
+def hourly_window_aggregates(values, start, interval, timezone, min_time, max_time, first=0, stop=None):
+    """
+    Reduce hourly weather to one row per local day, over the hours inside the
+    [min_time, max_time) window.
+    
+    Each variable takes one grouped reduction (np.ufunc.reduceat) over the
+    window hours: maximum temperature, minimum dew point, mean wind speed and
+    cloud cover, summed rain and snowfall, as daily_climate_score__hourly
+    computes them one day at a time.
+    
+    Args:
+        values: array of shape (len(HOURLY_COLUMNS), hours) on an implicit hourly index
+        start, interval: unix seconds of the first hour and the spacing in seconds
+        timezone: city timezone; days and the time window are local
+        min_time, max_time: 'HH:MM:SS' window bounds
+        first, stop: range of hours to aggregate
+    
+    Returns:
+        dates: datetime64[D] array of the local days
+        aggregates: list of six float64 arrays in _weather_columns order
+        complete: bool array, True where no value in the window was missing
+    """
+    stop = values.shape[1] if stop is None else stop
+    utc_seconds = start + interval * np.arange(first, stop, dtype=np.int64)
+    local = pd.to_datetime(utc_seconds, unit='s', utc=True).tz_convert(timezone).tz_localize(None)
+    local_seconds = local.to_numpy().astype('datetime64[s]').astype(np.int64)
+    days, seconds_of_day = np.divmod(local_seconds, 86400)
+    
+    in_window = np.flatnonzero(
+        (seconds_of_day >= pd.Timedelta(min_time).total_seconds())
+        & (seconds_of_day < pd.Timedelta(max_time).total_seconds())
+    )
+    if len(in_window) == 0:
+        return np.array([], dtype='datetime64[D]'), [np.array([])] * len(HOURLY_COLUMNS), np.array([], dtype=bool)
+    window_days = days[in_window]
+    # Hours are in time order, so each day's window hours are one contiguous run
+    day_starts = np.flatnonzero(np.r_[True, window_days[1:] != window_days[:-1]])
+    hours_per_day = np.diff(np.r_[day_starts, len(in_window)])
+    window_values = values[:, first:stop][:, in_window].astype(np.float64)
+    
+    aggregates = [
+        np.maximum.reduceat(window_values[0], day_starts),
+        np.minimum.reduceat(window_values[1], day_starts),
+        np.add.reduceat(window_values[2], day_starts) / hours_per_day,
+        np.add.reduceat(window_values[3], day_starts) / hours_per_day,
+        np.add.reduceat(window_values[4], day_starts),
+        np.add.reduceat(window_values[5], day_starts),
+    ]
+    complete = ~np.logical_or.reduceat(np.isnan(window_values).any(axis=0), day_starts)
+    return window_days[day_starts].astype('datetime64[D]'), aggregates, complete
+
+
+def hourly_store_firings(store, climate_score, timezone, from_date=None):
+    """
+    Find the rules firing on each local day of an hourly weather store, judged
+    on the hours inside the time window of climate_score. The store is processed
+    one local calendar year at a time, so the working memory stays at about a
+    year of hours however long the store is.
+    
+    Args:
+        store: dictionary from update_historical_hourly_store
+        climate_score: Score object; only its thresholds and time window are used
+        timezone: city timezone
+        from_date: only evaluate the days from this date on (default: the whole window)
+    
+    Returns:
+        DataFrame with date, firing (see outcome_lookup), weather_complete and year columns
+    """
+    start, interval, values = int(store['start']), int(store['interval']), store['values']
+    n_hours = values.shape[1]
+    # The store starts at midnight UTC, so the local day before may be partly covered
+    first_date = max(pd.Timestamp(start, unit='s').date(), from_date or date.min)
+    last_date = pd.Timestamp(start + (n_hours - 1) * interval, unit='s', tz='UTC').tz_convert(timezone).date()
+    
+    frames = []
+    for year in range(first_date.year, last_date.year + 1):
+        first, stop = [
+            min(n_hours, max(0, -(-(int(pd.Timestamp(year_start).tz_localize(timezone).timestamp()) - start) // interval)))
+            for year_start in (date(year, 1, 1), date(year + 1, 1, 1))
+        ]
+        dates, aggregates, complete = hourly_window_aggregates(
+            values, start, interval, timezone, climate_score.min_time, climate_score.max_time, first, stop
+        )
+        # The window already restricts the hours, so there is nothing to scale
+        frames.append(pd.DataFrame({
+            "date": dates.astype('datetime64[ns]'),
+            "firing": daily_firings__vectorized(*aggregates, 1.0, climate_score),
+            "weather_complete": complete,
+        }))
+    if not frames:
+        # from_date is past the end of the store
+        frames.append(pd.DataFrame({
+            "date": np.array([], dtype='datetime64[ns]'),
+            "firing": np.array([], dtype=np.uint8),
+            "weather_complete": np.array([], dtype=bool),
+        }))
+    score_df = pd.concat(frames, ignore_index=True)
+    score_df = score_df[(score_df["date"] >= pd.Timestamp(first_date)).to_numpy()].reset_index(drop=True)
+    score_df["year"] = score_df["date"].dt.year
+    return score_df
+
+
+# PM2.5 categories (µg/m³) shown in the air quality chart, as [min, max) ranges
+PM25_CATEGORIES = {
+    'Healthy': (0, 12),
+    'Moderate': (12, 35.5),
+    'Unhealthy for Sensitive': (35.5, 55.5),
+    'Unhealthy': (55.5, 150.5),
+    'Hazardous': (150.5, float('inf'))
+}
+PM25_START_DATE = date(2022, 1, 1)
+PM25_STORE_EXTENSION = '.npz'
+
+
+def pm25_category_histogram(values, start, interval, timezone, first_year=None):
+    """
+    Bin hourly PM2.5 values into PM25_CATEGORIES per local calendar year in a
+    single vectorized pass.
+    
+    Args:
+        values: hourly PM2.5 values on the implicit time index start + i * interval
+        start: UTC timestamp (seconds) of the first value
+        interval: seconds between values
+        timezone: city timezone, which decides the calendar year of each hour
+        first_year: first year to count, defaults to the year of the first value
+    
+    Returns:
+        years (int16), category_counts (int32, years × categories), valid_hours (int32)
+    """
+    if first_year is None:
+        first_year = pd.Timestamp(start, unit='s', tz='UTC').tz_convert(timezone).year
+    end = start + len(values) * interval
+    last_year = pd.Timestamp(end - 1, unit='s', tz='UTC').tz_convert(timezone).year
+    years = np.arange(first_year, last_year + 1, dtype=np.int16)
+    # Position of the first hour of each local year in the implicit time index
+    boundaries = [
+        pd.Timestamp(int(year), 1, 1).tz_localize(timezone).tz_convert('UTC').timestamp()
+        for year in range(first_year, last_year + 2)
+    ]
+    positions = np.clip(np.ceil((np.array(boundaries) - start) / interval).astype(np.int64), 0, len(values))
+    edges = np.array([min_val for min_val, _ in PM25_CATEGORIES.values()], dtype=np.float32)
+    n_categories = len(PM25_CATEGORIES)
+    
+    values = values[positions[0]:positions[-1]]
+    year_index = np.repeat(np.arange(len(years)), np.diff(positions))
+    valid = ~np.isnan(values)
+    category = np.searchsorted(edges, values, side='right') - 1
+    binned = valid & (category >= 0)
+    category_counts = np.bincount(
+        year_index[binned] * n_categories + category[binned], minlength=len(years) * n_categories
+    ).reshape(len(years), n_categories).astype(np.int32)
+    valid_hours = np.bincount(year_index[valid], minlength=len(years)).astype(np.int32)
+    return years, category_counts, valid_hours
+
+
+def pm25_category_percentages(category_counts, valid_hours):
+    """Share (%) of valid hours in each category per year; NaN for years without data."""
+    percentages = np.full(category_counts.shape, np.nan, dtype=np.float32)
+    np.divide(category_counts * 100, valid_hours[:, None], out=percentages, where=valid_hours[:, None] > 0)
+    return percentages
+
+
+def build_pm25_store(values, start, timezone, interval=3600, previous=None, changed_from=0):
+    """
+    Assemble a compact hourly PM2.5 store.
+    
+    The hourly values are kept as float32 against an implicit regular time index
+    (start + i * interval, in UTC seconds), next to the yearly category counts
+    and the year × category percentage table shown in the air quality chart.
+    
+    Args:
+        values: hourly PM2.5 values
+        start: UTC timestamp (seconds) of the first value
+        timezone: city timezone, which decides the calendar year of each hour
+        interval: seconds between values
+        previous: earlier store whose counts can be reused for years before changed_from
+        changed_from: index of the first value that differs from previous
+    
+    Returns:
+        Dictionary with start, interval, end, timezone, values, years, category_counts,
+        valid_hours and percentages
+    """
+    values = np.asarray(values, dtype=np.float32)
+    first_year = pd.Timestamp(start, unit='s', tz='UTC').tz_convert(timezone).year
+    if previous is not None and len(previous['years']):
+        changed_year = pd.Timestamp(start + changed_from * interval, unit='s', tz='UTC').tz_convert(timezone).year
+        first_year = max(first_year, min(changed_year, int(previous['years'][-1]) + 1))
+    years, category_counts, valid_hours = pm25_category_histogram(values, start, interval, timezone, first_year)
+    if previous is not None:
+        kept = previous['years'] < first_year
+        years = np.concatenate([previous['years'][kept], years])
+        category_counts = np.concatenate([previous['category_counts'][kept], category_counts])
+        valid_hours = np.concatenate([previous['valid_hours'][kept], valid_hours])
+    return {
+        'start': int(start),
+        'interval': int(interval),
+        'end': int(start + len(values) * interval),
+        'timezone': timezone,
+        'values': values,
+        'years': years,
+        'category_counts': category_counts,
+        'valid_hours': valid_hours,
+        'percentages': pm25_category_percentages(category_counts, valid_hours),
+    }
+
+
+def pm25_store_from_frame(df, timezone):
+    """Build a PM2.5 store from an hourly frame as returned by extract_data_from_api_response."""
+    if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
+        df = df.assign(datetime=pd.to_datetime(df['datetime'], utc=True))
+    seconds = ((df['datetime'] - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy()
+    interval = int(np.min(np.diff(seconds))) if len(seconds) > 1 else 3600
+    start = int(seconds.min())
+    values = np.full((seconds.max() - start) // interval + 1, np.nan, dtype=np.float32)
+    values[(seconds - start) // interval] = df['pm2_5__micrograms_per_cubic_metre'].to_numpy(dtype=np.float32)
+    return build_pm25_store(values, start, timezone, interval)
+
+
+def read_pm25_store(filename, summary_only=False):
+    """
+    Read a PM2.5 store file back into a store dictionary.
+    
+    Args:
+        filename: .npz store file
+        summary_only: skip the hourly values and read only the time range and yearly tables
+    """
+    store = read_array_file(filename, skip=('values',) if summary_only else ())
+    for name in ('start', 'interval'):
+        store[name] = int(store[name])
+    store['timezone'] = str(store['timezone'])
+    # Stores written before the percentage table was cached
+    if 'end' not in store:
+        if summary_only:
+            return read_pm25_store(filename)
+        store['end'] = store['start'] + len(store['values']) * store['interval']
+    else:
+        store['end'] = int(store['end'])
+    if 'percentages' not in store:
+        store['percentages'] = pm25_category_percentages(store['category_counts'], store['valid_hours'])
+    return store
+
+
+def load_pm25_store(filename, summary_only=False):
+    """
+    Load a PM2.5 store from the cache, updating its access information.
+    
+    Args:
+        filename: cache filename
+        summary_only: skip the hourly values (see read_pm25_store)
+    
+    Returns:
+        Store dictionary if the file exists, None otherwise
+    """
+    if not os.path.exists(filename):
+        return None
+    try:
+        update_cache_access_info(filename)
+        return read_pm25_store(filename, summary_only=summary_only)
+    except Exception as e:
+        print(f"Error loading cached data from {filename}: {e}")
+        return None
+
+
+def save_pm25_store(store, filename):
+    """
+    Save a PM2.5 store and register it in the cache directory.
+    
+    Args:
+        store: dictionary from build_pm25_store
+        filename: cache filename ending in PM25_STORE_EXTENSION
+    """
+    save_cached_arrays(store, filename)
+
+
+def _import_legacy_pm25_cache(filename, timezone):
+    """Convert an hourly PM2.5 frame cached in any CACHE_FORMATS format into a store."""
+    stem = os.path.splitext(filename)[0]
+    for backend in CACHE_FORMATS.values():
+        legacy_filename = stem + backend['extension']
+        if not os.path.exists(legacy_filename):
+            continue
+        try:
+            store = pm25_store_from_frame(read_cache_file(legacy_filename), timezone)
+            write_array_file(store, filename)
+            os.remove(legacy_filename)
+            rename_cache_entry(legacy_filename, filename)
+            print(f"Migrated cache file {legacy_filename} -> {filename}")
+            return store
+        except Exception as e:
+            print(f"Error migrating cached data from {legacy_filename}: {e}")
+    return None
+
+
+def update_pm25_store(lat, long, city_timezone, city, state, cache_filename, save_csv=True):
+    """
+    Load the cached hourly PM2.5 store and append any new hours.
+    
+    Only the hours after the last cached value are requested from the air
+    quality API; the yearly category counts are recomputed only for the years
+    those hours fall in.
+    
+    Args:
+        lat, long: coordinates
+        city_timezone: timezone string
+        city, state: location identifiers
+        cache_filename: historical_pm25 cache file
+        save_csv: whether to save the refreshed store to the cache
+    
+    Returns:
+        PM2.5 store dictionary (see build_pm25_store)
+    """
+    today = date.today()
+    # Check freshness from the summary first so warm loads never read the hourly values
+    store = load_pm25_store(cache_filename, summary_only=True)
+    if store is not None and pd.Timestamp(store['end'], unit='s', tz='UTC').date() > today:
+        print(f"Loading historical pm2.5 from cache: {cache_filename}")
+        return store
+    if store is not None:
+        store = read_pm25_store(cache_filename)
+    else:
+        store = _import_legacy_pm25_cache(cache_filename, city_timezone)
+    
+    fetch_start = PM25_START_DATE
+    if store is not None:
+        if pd.Timestamp(store['end'], unit='s', tz='UTC').date() > today:
+            return store
+        valid = np.flatnonzero(~np.isnan(store['values']))
+        if len(valid):
+            last_valid = pd.Timestamp(store['start'] + valid[-1] * store['interval'], unit='s', tz='UTC')
+            fetch_start = last_valid.date() + dt.timedelta(days=1) if last_valid.hour == 23 else last_valid.date()
+    
+    print(f"Fetching historical pm2.5 for {city}, {state} from {fetch_start} to {today} from API...")
+    openmeteo = get_openmeteo_client()
+    url = "https://air-quality-api.open-meteo.com/v1/air-quality"
+    aqi_col_names = ["pm2_5"]
+    params = {
+        "latitude": lat,
+        "longitude": long,
+        "hourly": aqi_col_names,
+        "start_date": fetch_start,
+        "end_date": today,
+        "timezone": 'GMT'
+    }
+    responses = openmeteo.weather_api(url, params=params)
+    hourly = responses[0].Hourly()
+    new_values = hourly.Variables(0).ValuesAsNumpy().astype(np.float32)
+    
+    if store is not None and fetch_start > PM25_START_DATE:
+        # Splice the new hours onto the cached values at their position in the time index
+        offset = (hourly.Time() - store['start']) // store['interval']
+        values = np.concatenate([store['values'][:offset], new_values])
+        store = build_pm25_store(values, store['start'], city_timezone, store['interval'], previous=store, changed_from=offset)
+    else:
+        store = build_pm25_store(new_values, hourly.Time(), city_timezone, hourly.Interval())
+    
+    if save_csv:
+        save_pm25_store(store, cache_filename)
+    return store
+
+
+def pm25_category_table(store):
+    """
+    Year × category percentage table of a PM2.5 store, as plotted in the air quality chart.
+    
+    Returns:
+        DataFrame indexed by year with one column per PM25_CATEGORIES entry holding
+        the share (%) of hours with a value that fell in that category
+    """
+    return pd.DataFrame(store['percentages'], index=pd.Index(store['years'], name='year'), columns=list(PM25_CATEGORIES))
+
+
+def get_historical_and_aqi_data(lat, long, city_timezone, city, state, col_names=None, save_csv=True, resolution="daily"):
+    """
+    Get the historical weather and the yearly PM2.5 category counts for a city,
+    refreshing both caches with only the data that is missing.
+    
+    Args:
+        resolution: 'daily' for the daily weather, 'hourly' for the hourly
+            weather store (see update_historical_hourly_store)
+    
+    Returns:
+        df_historical_weather: daily weather dataframe (the hourly store for resolution='hourly')
+        df_pm25_categories: yearly PM2.5 category percentages (see pm25_category_table)
+        cache_filename_weather, cache_filename_pm25: cache filenames, None if not saved
+    """
+    if col_names is None:
+        col_names = [
+            "temperature_2m_max", "dew_point_2m_min", "rain_sum", "snowfall_sum", "cloud_cover_mean", "wind_speed_10m_mean"
+        ]
+    cache_filename_weather = get_cache_filename(f"historical_{resolution}", city, state)
+    cache_filename_pm25 = get_cache_filename("historical_pm25", city, state)
+    
+    def refresh():
+        if resolution == "hourly":
+            df_historical_weather = update_historical_hourly_store(
+                lat, long, city, state, cache_filename_weather, save_csv=save_csv
+            )
+        else:
+            df_historical_weather = update_historical_daily_data(
+                lat, long, city, state, col_names, cache_filename_weather, save_csv=save_csv
+            )
+        pm25_store = update_pm25_store(lat, long, city_timezone, city, state, cache_filename_pm25, save_csv=save_csv)
+        return df_historical_weather, pm25_store
+    
+    # Concurrent requests for the same city share one refresh and its API calls
+    df_historical_weather, pm25_store = _cache_flights.do(cache_filename_weather, refresh)
+
+    if not save_csv:
+        cache_filename_weather = None
+        cache_filename_pm25 = None
+
+    return df_historical_weather, pm25_category_table(pm25_store), cache_filename_weather, cache_filename_pm25
+
+
+def get_forecasted_data(lat, long, city_timezone, city, state, model, col_names=None, save_csv=True):
+    if col_names is None:
+        col_names = ["temperature_2m_max", "wind_speed_10m_mean", "dew_point_2m_min", "rain_sum", "cloud_cover_mean", "snowfall_sum"]
+    
+    # Check cache first
+    cache_filename = get_cache_filename("forecasted", city, state, model)
+    cached_df = load_cached_data(cache_filename, "forecasted")
+    if cached_df is not None:
+        print(f"Loading forecasted data from cache: {cache_filename}")
+        return cached_df, cache_filename
+    
+    def fetch():
+        print(f"Fetching forecasted data for {city}, {state} with model {model} from API...")
+        openmeteo = get_openmeteo_client()
+        url = "https://climate-api.open-meteo.com/v1/climate"
+        params = {
+            "latitude": lat,
+            "longitude": long,
+            "start_date": date.today(),
+            "end_date": date(date.today().year + 24, 12, 31),
+            "models": model,
+            "daily": col_names
+        }
+        responses = openmeteo.weather_api(url, params=params)
+        df_single_model = extract_data_from_api_response(responses[0].Daily(), col_names, hourly=False, timezone=city_timezone)
+        df_single_model.columns = [
+            col if col == 'date' else col + f'__{model}'
+            for col in df_single_model.columns
+        ]
+        df_single_model = apply_frame_schema(df_single_model, "forecasted")
+        
+        # Save to cache
+        if save_csv:
+            save_cached_data(df_single_model, cache_filename)
+        return df_single_model
+    
+    # Concurrent requests for the same uncached city share one fetch
+    df_single_model = _cache_flights.do(cache_filename, fetch)
+    if not save_csv:
+        cache_filename = None
+    return df_single_model, cache_filename
+
+
+def process_historical_for_plotting(df, climate_score, city=None, state=None):
+    """
+    Score the historical daily weather in two stages. The rule firings of each day
+    are cached per set of thresholds (see Score.get_threshold_parameters); when they
+    exist only the days that are new, or whose weather has been filled in since,
+    are evaluated again. The coefficients are then applied with apply_coefficients,
+    so preferences differing only in coefficients share one cache.
+    
+    Args:
+        df: historical daily weather dataframe
+        climate_score: Score object with preferences
+        city, state: location identifiers for caching
+    
+    Returns:
+        score_df: DataFrame with date, weather_complete, year and outcome (see outcome_tables) columns
+        reasons: list of reasons aligned with score_df
+    """
+    reason_table = outcome_tables(climate_score)[1]
+    cached_df = None
+    # Check cache first if city and state are provided
+    if city and state:
+        threshold_params = climate_score.get_threshold_parameters()
+        cache_filename = get_cache_filename("historical_score", city, state, score_params=threshold_params)
+        cached_df = load_cached_data(cache_filename, "historical_score")
+        if cached_df is not None and "firing" not in cached_df.columns:
+            cached_df = None
+
+    weather_dates = pd.to_datetime(df["date"].astype(str))
+    weather_complete = np.isfinite(np.column_stack(_weather_columns(df))).all(axis=1)
+    to_score = np.ones(len(df), dtype=bool)
+    kept_firings = None
+    if cached_df is not None:
+        cached_dates = pd.to_datetime(cached_df["date"])
+        # Cached firings are final once their weather was complete
+        now_complete = pd.Series(weather_complete, index=weather_dates)
+        now_complete = now_complete[~now_complete.index.duplicated()]
+        settled = cached_df["weather_complete"].to_numpy(dtype=bool) | ~now_complete.reindex(cached_dates, fill_value=False).to_numpy()
+        keep = settled & cached_dates.isin(weather_dates).to_numpy()
+        to_score = ~weather_dates.isin(cached_dates[keep]).to_numpy()
+        if keep.all() and not to_score.any():
+            print(f"Loading historical rule firings from cache: {cache_filename}")
+            score_df = apply_coefficients(cached_df, climate_score)
+            return score_df, reason_table[score_df["outcome"].to_numpy()].tolist()
+        kept_firings = cached_df[keep]
+        print(f"Updating historical rule firings for {to_score.sum()} new days...")
+    else:
+        print("Processing historical daily data for plotting...")
+
+    new_rows = df[to_score]
+    firing_df = pd.DataFrame({
+        "date": weather_dates[to_score].to_numpy(),
+        "firing": weather_frame_firings(new_rows, climate_score),
+        "weather_complete": weather_complete[to_score]
+    })
+    if kept_firings is not None:
+        kept_firings = kept_firings.assign(date=pd.to_datetime(kept_firings["date"]))
+        firing_df = pd.concat([kept_firings[firing_df.columns], firing_df], ignore_index=True)
+        firing_df = firing_df.sort_values("date", kind="stable").reset_index(drop=True)
+    firing_df["year"] = firing_df["date"].dt.year
+    firing_df = apply_frame_schema(firing_df, "historical_score")
+
+    # Save to cache if city and state are provided
+    if city and state:
+        save_cached_data(firing_df, cache_filename)
+
+    score_df = apply_coefficients(firing_df, climate_score)
+    return score_df, reason_table[score_df["outcome"].to_numpy()].tolist()
+
+
+def process_historical_hourly_for_plotting(store, climate_score, timezone, city=None, state=None):
+    """
+    Score the hourly historical weather in two stages, like
+    process_historical_for_plotting. The rule firings of each day (see
+    hourly_store_firings) are cached per set of thresholds. They are used as they
+    are while the store has not changed since they were written; otherwise only
+    the years from the first day that was evaluated on incomplete weather (or the
+    first new day) are evaluated again. The coefficients are then applied with
+    apply_coefficients.
+    
+    Args:
+        store: hourly weather store from update_historical_hourly_store
+        climate_score: Score object with preferences
+        timezone: city timezone
+        city, state: location identifiers for caching
+    
+    Returns:
+        score_df: DataFrame with date, weather_complete, year and outcome (see outcome_tables) columns
+        reasons: list of reasons aligned with score_df
+    """
+    cached_df = None
+    if city and state:
+        threshold_params = climate_score.get_threshold_parameters()
+        cache_filename = get_cache_filename("historical_hourly_score", city, state, score_params=threshold_params)
+        cached_df = load_cached_data(cache_filename, "historical_hourly_score")
+        if cached_df is not None and "firing" not in cached_df.columns:
+            cached_df = None
+        store_filename = get_cache_filename("historical_hourly", city, state)
+        if (cached_df is not None and os.path.exists(store_filename)
+                and os.path.getmtime(cache_filename) >= os.path.getmtime(store_filename)):
+            # Nothing has been fetched since the firings were evaluated
+            print(f"Loading historical hourly rule firings from cache: {cache_filename}")
+            score_df = apply_coefficients(cached_df, climate_score)
+            return score_df, outcome_tables(climate_score)[1][score_df["outcome"].to_numpy()].tolist()
+    
+    from_date = None
+    window_start = pd.Timestamp(get_historical_window_start())
+    if cached_df is not None:
+        cached_dates = pd.to_datetime(cached_df["date"])
+        unsettled = ~cached_df["weather_complete"].to_numpy(dtype=bool)
+        rescore_from = cached_dates[unsettled].min() if unsettled.any() else cached_dates.max() + pd.Timedelta(days=1)
+        # Whole years are evaluated again, matching the year-at-a-time processing
+        from_date = date(rescore_from.year, 1, 1)
+        print(f"Updating historical hourly rule firings from {from_date}...")
+    else:
+        print("Processing historical hourly data for plotting...")
+    
+    firing_df = hourly_store_firings(store, climate_score, timezone, from_date=from_date)
+    if cached_df is not None:
+        kept = cached_df[((cached_dates >= window_start) & (cached_dates < pd.Timestamp(from_date))).to_numpy()]
+        firing_df = pd.concat([kept.assign(date=pd.to_datetime(kept["date"]))[firing_df.columns], firing_df], ignore_index=True)
+    firing_df = apply_frame_schema(firing_df, "historical_hourly_score")
+    
+    # Save to cache if city and state are provided
+    if city and state:
+        save_cached_data(firing_df, cache_filename)
+    
+    score_df = apply_coefficients(firing_df, climate_score)
+    return score_df, outcome_tables(climate_score)[1][score_df["outcome"].to_numpy()].tolist()
+
+
+def process_forecasted_for_plotting(df, climate_score, model="NICAM16_8S", city=None, state=None):
+    # Rule firings are cached per set of thresholds; the coefficients are applied on top
+    if city and state: 
+        threshold_params = climate_score.get_threshold_parameters()
+        cache_filename = get_cache_filename("forecasted_score", city, state, model, threshold_params)
+        cached_df = load_cached_data(cache_filename, "forecasted_score")
+        if cached_df is not None and "firing" in cached_df.columns:
+            print(f"Loading forecasted rule firings from cache: {cache_filename}")
+            score_df_forecasted = apply_coefficients(cached_df, climate_score)
+            reasons = outcome_tables(climate_score)[1][score_df_forecasted["outcome"].to_numpy()].tolist()
+            return score_df_forecasted, reasons
+    
+    print(f"Processing forecasted data for plotting with model {model}...")
+    df["date"] = df["date"].astype(str)
+    firing_df = pd.DataFrame({"date": df["date"].to_numpy(), "firing": weather_frame_firings(df, climate_score, suffix=f'__{model}')})
+    firing_df["date"] = pd.to_datetime(firing_df["date"])
+    firing_df["year"] = firing_df["date"].dt.year
+    firing_df = apply_frame_schema(firing_df, "forecasted_score")
+    
+    # Save to cache if city and state are provided
+    if city and state:
+        save_cached_data(firing_df, cache_filename)
+    
+    score_df_forecasted = apply_coefficients(firing_df, climate_score)
+    reasons_forecasted = outcome_tables(climate_score)[1][score_df_forecasted["outcome"].to_numpy()].tolist()
+    return score_df_forecasted, reasons_forecasted
+
+
+def combine_model_frames(model_dataframes, models):
+    """
+    Combine per-model daily frames into one wide frame keyed on date.
+    
+    All columns are gathered first and the frame is built in a single
+    allocation. Models normally share the same date range; if they do not,
+    each model is aligned onto the sorted union of dates (like an outer merge).
+    
+    Args:
+        model_dataframes: dictionary of model name -> frame from extract_data_from_api_response
+        models: list of model names, giving the column order
+    
+    Returns:
+        DataFrame with a date column and model-suffixed columns for every model
+    """
+    first_dates = model_dataframes[models[0]]['date'].to_numpy()
+    same_dates = all(
+        len(model_dataframes[model]) == len(first_dates)
+        and (model_dataframes[model]['date'].to_numpy() == first_dates).all()
+        for model in models[1:]
+    )
+    if same_dates:
+        dates = pd.Index(first_dates)
+    else:
+        dates = pd.Index(first_dates)
+        for model in models[1:]:
+            dates = dates.union(pd.Index(model_dataframes[model]['date'].to_numpy()))
+    
+    columns = {'date': dates.to_numpy()}
+    for model in models:
+        df_model = model_dataframes[model]
+        if not same_dates:
+            df_model = df_model.set_index('date').reindex(dates)
+        for col in df_model.columns:
+            if col != 'date':
+                columns[col + f'__{model}'] = df_model[col].to_numpy()
+    return pd.DataFrame(columns)
+
+
+def get_combined_forecasted_data(lat, long, city_timezone, city, state, models=None, col_names=None, save_csv=True):
+    """
+    Fetch forecasted data for multiple models and return a combined dataframe.
+    
+    Args:
+        lat, long: coordinates
+        city_timezone: timezone string
+        city, state: location identifiers
+        models: list of model names to fetch data for
+        col_names: list of column names to fetch
+        save_csv: whether to save to cache
+    
+    Returns:
+        combined_df: DataFrame with date/year columns and model-specific score/reason columns
+        cache_filename: cache filename if saved, None otherwise
+    """
+    if models is None:
+        models = ["EC_Earth3P_HR", "MRI_AGCM3_2_S", "NICAM16_8S"]
+    if col_names is None:
+        col_names = ["temperature_2m_max", "wind_speed_10m_mean", "dew_point_2m_min", "rain_sum", "cloud_cover_mean", "snowfall_sum"]
+    
+    # Check cache first
+    cache_filename = get_cache_filename("combined_forecasted", city, state, models=models)
+    cached_df = load_cached_data(cache_filename, "combined_forecasted")
+    if cached_df is not None:
+        print(f"Loading combined forecasted data from cache: {cache_filename}")
+        return cached_df, cache_filename
+    
+    def fetch_model(model):
+        openmeteo = get_openmeteo_client()
+        url = "https://climate-api.open-meteo.com/v1/climate"
+        params = {
+            "latitude": lat,
+            "longitude": long,
+            "start_date": date.today(),
+            "end_date": date(date.today().year + 24, 12, 31),
+            "models": model,
+            "daily": col_names
+        }
+        responses = openmeteo.weather_api(url, params=params)
+        return extract_data_from_api_response(responses[0].Daily(), col_names, hourly=False, timezone=city_timezone)
+    
+    def fetch():
+        print(f"Fetching combined forecasted data for {city}, {state} with models {models} from API...")
+        # Request all models at once so the cold-cache latency is that of the slowest model
+        with ThreadPoolExecutor(max_workers=len(models)) as executor:
+            model_dataframes = dict(zip(models, executor.map(fetch_model, models)))
+        
+        combined_df = combine_model_frames(model_dataframes, models)
+        
+        # Add year column
+        combined_df['year'] = pd.to_datetime(combined_df['date']).dt.year
+        combined_df = apply_frame_schema(combined_df, "combined_forecasted")
+        
+        # Save to cache
+        if save_csv:
+            save_cached_data(combined_df, cache_filename)
+        return combined_df
+    
+    # Concurrent requests for the same uncached city share one fetch
+    combined_df = _cache_flights.do(cache_filename, fetch)
+    if not save_csv:
+        cache_filename = None
+    
+    return combined_df, cache_filename
+
+
+def process_combined_forecasted_for_plotting(df, climate_score, models=None, city=None, state=None):
+    """
+    Process combined forecasted data for plotting, generating scores for all models.
+    
+    Scoring runs in two stages: the rule firings of every model are cached per set of
+    thresholds (see Score.get_threshold_parameters), then the coefficients are applied
+    with apply_coefficients. With the firings cached the forecast weather is not
+    needed at all, so df may be given as a function that is only called on a cache miss.
+    
+    Args:
+        df: combined forecasted dataframe with model-specific columns, or a function returning it
+        climate_score: Score object with preferences
+        models: list of model names
+        city, state: location identifiers for caching
+    
+    Returns:
+        processed_df: DataFrame with date, year, and model-specific outcome_{model} columns (see outcome_tables)
+        all_reasons: list of all unique reasons across all models
+    """
+    if models is None:
+        models = ["EC_Earth3P_HR", "MRI_AGCM3_2_S", "NICAM16_8S"]
+    
+    # Check cache first if city and state are provided
+    firing_df = None
+    if city and state:
+        threshold_params = climate_score.get_threshold_parameters()
+        cache_filename = get_cache_filename("combined_forecasted_score", city, state, models=models, score_params=threshold_params)
+        cached_df = load_cached_data(cache_filename, "combined_forecasted_score")
+        if cached_df is not None and all(f'firing_{model}' in cached_df.columns for model in models):
+            print(f"Loading combined forecasted rule firings from cache: {cache_filename}")
+            firing_df = cached_df
+    
+    if firing_df is None:
+        if callable(df):
+            df = df()
+        print(f"Processing combined forecasted data for plotting with models {models}...")
+        
+        # Initialize result dataframe with date and year
+        firing_df = df[['date', 'year']].copy()
+        
+        # Process each model
+        for model in models:
+            firing_df[f'firing_{model}'] = weather_frame_firings(df, climate_score, suffix=f'__{model}')
+        firing_df = apply_frame_schema(firing_df, "combined_forecasted_score")
+        
+        # Save to cache if city and state are provided
+        if city and state:
+            save_cached_data(firing_df, cache_filename)
+    
+    result_df = apply_coefficients(firing_df, climate_score)
+    outcome_cols = [f'outcome_{model}' for model in models]
+    all_reasons = [SCORE_REASONS[code] for code in np.unique(result_df[outcome_cols].to_numpy())]
+    return result_df, all_reasons
+
+
+def reason_distribution(scored_historical_df, scored_forecasted_df):
+    """
+    Count score reasons per year for the historical data and for every forecast model.
+    
+    The outcome codes are the reason indices, so the counts are a single bincount over
+    (year, code) for the history and over (year, code, model) for the forecast; the
+    forecast mean, min and max are then taken across the model axis. When the last
+    historical year is also the first forecast year, that year's counts are combined:
+    the historical count and the forecast mean/min/max each get the other part of the
+    year added.
+    
+    Args:
+        scored_historical_df: historical scores with year and outcome columns
+        scored_forecasted_df: combined forecast scores with year and outcome_{model} columns
+    
+    Returns:
+        Dictionary with
+            reasons: the reason labels (columns of the arrays below), SCORE_REASONS
+            historical_years, historical: years and (years × reasons) counts
+            forecast_years, forecast_mean, forecast_min, forecast_max: years and (years × reasons) counts
+            present: whether each reason occurs anywhere
+    """
+    n_reasons = len(SCORE_REASONS)
+    
+    historical_years, year_index = np.unique(scored_historical_df['year'].to_numpy(), return_inverse=True)
+    codes = scored_historical_df['outcome'].to_numpy().astype(np.int64)
+    historical = np.bincount(
+        year_index * n_reasons + codes, minlength=len(historical_years) * n_reasons
+    ).reshape(len(historical_years), n_reasons).astype(float)
+    
+    outcome_cols = [col for col in scored_forecasted_df.columns if col.startswith('outcome_')]
+    n_models = len(outcome_cols)
+    forecast_years, year_index = np.unique(scored_forecasted_df['year'].to_numpy(), return_inverse=True)
+    if n_models:
+        codes = scored_forecasted_df[outcome_cols].to_numpy().astype(np.int64)
+        cells = (year_index[:, None] * n_reasons + codes) * n_models + np.arange(n_models)
+        counts = np.bincount(
+            cells.ravel(), minlength=len(forecast_years) * n_reasons * n_models
+        ).reshape(len(forecast_years), n_reasons, n_models).astype(float)
+    else:
+        counts = np.zeros((len(forecast_years), n_reasons, 1))
+    forecast_mean = counts.mean(axis=2)
+    forecast_min = counts.min(axis=2)
+    forecast_max = counts.max(axis=2)
+    
+    present = (historical.sum(axis=0) > 0) | (forecast_max.sum(axis=0) > 0)
+    
+    # Merge the year shared by the end of the history and the start of the forecast
+    if len(historical_years) and len(forecast_years) and historical_years[-1] == forecast_years[0]:
+        shared_historical = historical[-1].copy()
+        historical[-1] += forecast_mean[0]
+        forecast_mean[0] += shared_historical
+        forecast_min[0] += shared_historical
+        forecast_max[0] += shared_historical
+    
+    return {
+        'reasons': list(SCORE_REASONS),
+        'historical_years': historical_years,
+        'historical': historical,
+        'forecast_years': forecast_years,
+        'forecast_mean': forecast_mean,
+        'forecast_min': forecast_min,
+        'forecast_max': forecast_max,
+        'present': present,
+    }
+
+
+# Possible daily scores, in the order of the score distribution chart
+SCORE_VALUES = (0, 25, 50, 75, 100)
+
+
+def _mean_ignoring_nan(values, axis):
+    """Mean along an axis skipping NaN (like pandas), NaN where every value is missing."""
+    finite = ~np.isnan(values)
+    count = finite.sum(axis=axis)
+    total = np.where(finite, values, 0).sum(axis=axis)
+    return np.divide(total, count, out=np.full(count.shape, np.nan), where=count > 0)
+
+
+def _grouped_mean(group_index, n_groups, values):
+    """Mean of values per group index, NaN for groups without values."""
+    valid = ~np.isnan(values)
+    total = np.bincount(group_index[valid], weights=values[valid], minlength=n_groups)
+    count = np.bincount(group_index[valid], minlength=n_groups)
+    return np.divide(total, count, out=np.full(n_groups, np.nan), where=count > 0)
+
+
+def score_summary(scored_historical_df, scored_forecasted_df, climate_score):
+    """
+    Aggregate the scored frames into everything the score charts plot. Scores are
+    looked up from the outcome codes, and the score and reason counts are bincounts
+    over the codes.
+    
+    Args:
+        scored_historical_df: historical scores with date, year and outcome columns
+        scored_forecasted_df: combined forecast scores with date, year and outcome_{model} columns
+        climate_score: Score the frames were scored with, giving the score of each outcome code
+    
+    Returns:
+        Dictionary of arrays:
+            years: every year with data; historical_shares, forecast_shares: (years × SCORE_VALUES)
+                share (%) of each year's days with that score, the forecast averaged across models
+            historical_years, historical_mean: yearly historical mean score
+            forecast_years, forecast_mean, forecast_min, forecast_max: yearly forecast mean score
+                averaged across models, with the lowest and highest model
+            historical_monthly, forecast_monthly: (years × 12) monthly mean scores
+            min_forecasted_year: first forecast year
+            reason_*: the reason counts from reason_distribution
+        The year shared by the end of the history and the start of the forecast is
+        merged, weighting each side by its number of days.
+    """
+    outcome_cols = [col for col in scored_forecasted_df.columns if col.startswith('outcome_')]
+    historical_days = pd.to_datetime(scored_historical_df['date']).to_numpy().astype('datetime64[D]')
+    forecast_days = pd.to_datetime(scored_forecasted_df['date']).to_numpy().astype('datetime64[D]')
+    historical_year = scored_historical_df['year'].to_numpy().astype(np.int64)
+    forecast_year = scored_forecasted_df['year'].to_numpy().astype(np.int64)
+    historical_outcomes = scored_historical_df['outcome'].to_numpy(dtype=np.uint8)
+    forecast_outcomes = scored_forecasted_df[outcome_cols].to_numpy(dtype=np.uint8).reshape(len(scored_forecasted_df), len(outcome_cols))
+    score_table = outcome_tables(climate_score)[0]
+    historical_scores = score_table[historical_outcomes].astype(np.float64)
+    forecast_scores = score_table[forecast_outcomes].astype(np.float64)
+    n_values = len(SCORE_VALUES)
+    # Position in SCORE_VALUES of each outcome code's score
+    value_index = np.searchsorted(SCORE_VALUES, score_table)
+    
+    # --- Score distribution: share of each year's distinct days with each score ---
+    years = np.union1d(historical_year, forecast_year)
+    days = np.unique(np.concatenate([historical_days, forecast_days]))
+    day_years = days.astype('datetime64[Y]').astype(np.int64) + 1970
+    dates_per_year = np.bincount(np.searchsorted(years, day_years), minlength=len(years)).astype(float)
+    
+    def score_counts(year_index, outcomes):
+        return np.bincount(
+            year_index * n_values + value_index[outcomes], minlength=len(years) * n_values
+        ).reshape(len(years), n_values)
+    
+    historical_shares = 100 * score_counts(np.searchsorted(years, historical_year), historical_outcomes) / dates_per_year[:, None]
+    forecast_index = np.searchsorted(years, forecast_year)
+    model_shares = [100 * score_counts(forecast_index, forecast_outcomes[:, m]) / dates_per_year[:, None] for m in range(len(outcome_cols))]
+    forecast_shares = np.mean(model_shares, axis=0) if model_shares else np.zeros((len(years), n_values))
+    
+    # --- Yearly means, with the range across models ---
+    historical_years, historical_index = np.unique(historical_year, return_inverse=True)
+    historical_mean = _grouped_mean(historical_index, len(historical_years), historical_scores)
+    forecast_years, forecast_index = np.unique(forecast_year, return_inverse=True)
+    model_means = np.column_stack(
+        [_grouped_mean(forecast_index, len(forecast_years), forecast_scores[:, m]) for m in range(len(outcome_cols))]
+    ) if outcome_cols else np.full((len(forecast_years), 1), np.nan)
+    forecast_mean = _mean_ignoring_nan(model_means, axis=1)
+    forecast_min = np.fmin.reduce(model_means, axis=1)
+    forecast_max = np.fmax.reduce(model_means, axis=1)
+    
+    if len(historical_years) and len(forecast_years) and historical_years[-1] == forecast_years[0]:
+        shared_year = historical_years[-1]
+        num_days_shared_historical = len(np.unique(historical_days[historical_year == shared_year]))
+        num_days_shared_forecasted = len(np.unique(forecast_days[forecast_year == shared_year]))
+        total_days = num_days_shared_historical + num_days_shared_forecasted
+        hist_weight = num_days_shared_historical / total_days
+        fore_weight = num_days_shared_forecasted / total_days
+        hist_avg = historical_mean[-1]
+        forecast_mean[0] = hist_avg * hist_weight + forecast_mean[0] * fore_weight
+        forecast_min[0] = hist_avg * hist_weight + forecast_min[0] * fore_weight
+        forecast_max[0] = hist_avg * hist_weight + forecast_max[0] * fore_weight
+        historical_mean[-1] = forecast_mean[0]
+    
+    # --- Monthly means per year ---
+    historical_months = historical_days.astype('datetime64[M]').astype(np.int64) % 12
+    historical_monthly = _grouped_mean(
+        historical_index * 12 + historical_months, len(historical_years) * 12, historical_scores
+    ).reshape(len(historical_years), 12)
+    forecast_months = forecast_days.astype('datetime64[M]').astype(np.int64) % 12
+    model_monthly = np.stack(
+        [_grouped_mean(forecast_index * 12 + forecast_months, len(forecast_years) * 12, forecast_scores[:, m]) for m in range(len(outcome_cols))],
+        axis=-1
+    ) if outcome_cols else np.full((len(forecast_years) * 12, 1), np.nan)
+    forecast_monthly = _mean_ignoring_nan(model_monthly, axis=-1).reshape(len(forecast_years), 12)
+    
+    if len(forecast_days):
+        min_forecasted_year = int(forecast_days.min().astype('datetime64[Y]').astype(np.int64) + 1970)
+    else:
+        min_forecasted_year = int(historical_years.max()) if len(historical_years) else 0
+    
+    summary = {
+        'years': years,
+        'historical_shares': historical_shares,
+        'forecast_shares': forecast_shares,
+        'historical_years': historical_years,
+        'historical_mean': historical_mean,
+        'forecast_years': forecast_years,
+        'forecast_mean': forecast_mean,
+        'forecast_min': forecast_min,
+        'forecast_max': forecast_max,
+        'historical_monthly': historical_monthly,
+        'forecast_monthly': forecast_monthly,
+        'min_forecasted_year': min_forecasted_year,
+    }
+    reasons = reason_distribution(scored_historical_df, scored_forecasted_df)
+    summary.update({
+        'reasons': reasons['reasons'],
+        'reason_historical': reasons['historical'],
+        'reason_forecast_mean': reasons['forecast_mean'],
+        'reason_forecast_min': reasons['forecast_min'],
+        'reason_forecast_max': reasons['forecast_max'],
+        'reason_present': reasons['present'],
+    })
+    return summary
+
+
+def load_score_summary(filename, sources):
+    """
+    Load a cached score summary if it is newer than every cache file it was built from.
+    
+    Args:
+        filename: score_summary cache file
+        sources: cache files the summary depends on
+    
+    Returns:
+        Summary dictionary, or None if it is missing or out of date
+    """
+    try:
+        if not all(os.path.exists(source) for source in sources + [filename]):
+            return None
+        if os.path.getmtime(filename) < max(os.path.getmtime(source) for source in sources):
+            return None
+    except OSError:
+        return None
+    summary = load_cached_arrays(filename)
+    if summary is not None:
+        summary['min_forecasted_year'] = int(summary['min_forecasted_year'])
+        summary['reasons'] = summary['reasons'].tolist()
+    return summary
+
+
+# Stages of fetch_and_score_city, in order, as passed to its progress callback
+PIPELINE_STAGES = ('geocode', 'historical fetch', 'forecast fetch', 'scoring', 'aggregation')
+
+
+def fetch_and_score_city(city, state, climate_score, models=None, progress=None, resolution=None):
+    """
+    Run the full data pipeline for one city: geocoding, historical/AQI and
+    forecast retrieval, scoring and aggregation.
+    
+    The aggregates are cached per (city, state, models, score parameters); when
+    that summary is newer than the weather and score caches it was built from,
+    the scored frames are not loaded at all. The score caches hold rule firings
+    keyed by the thresholds only, so new coefficients are scored from them without
+    the forecast weather.
+    
+    Args:
+        city, state: location identifiers
+        climate_score: Score object with preferences
+        models: list of model names for the combined forecast
+        progress: optional callable, called with each of PIPELINE_STAGES as it starts
+            (stages the cached summary makes unnecessary are skipped)
+        resolution: 'daily' or 'hourly' historical scoring, defaults to get_historical_resolution()
+    
+    Returns:
+        Dictionary with the city location, the PM2.5 category table and the
+        score summary (see score_summary)
+    """
+    if models is None:
+        models = ["EC_Earth3P_HR", "MRI_AGCM3_2_S", "NICAM16_8S"]
+    if progress is None:
+        progress = lambda stage: None
+    if resolution is None:
+        resolution = get_historical_resolution()
+    progress('geocode')
+    lat, lon, timezone, pop = get_city_info(city, state)
+    progress('historical fetch')
+    historical_weather, pm25_categories_df, _, _ = get_historical_and_aqi_data(
+        lat, lon, timezone, city, state, resolution=resolution
+    )
+    
+    score_params = climate_score.get_all_parameters()
+    threshold_params = climate_score.get_threshold_parameters()
+    # Hourly summaries get their own files; daily ones keep their existing names
+    summary_params = score_params if resolution == 'daily' else dict(score_params, resolution=resolution)
+    summary_filename = get_cache_filename("score_summary", city, state, models=models, score_params=summary_params)
+    historical_score_type = "historical_score" if resolution == 'daily' else "historical_hourly_score"
+    sources = [
+        get_cache_filename(f"historical_{resolution}", city, state),
+        get_cache_filename(historical_score_type, city, state, score_params=threshold_params),
+        get_cache_filename("combined_forecasted", city, state, models=models),
+        get_cache_filename("combined_forecasted_score", city, state, models=models, score_params=threshold_params),
+    ]
+    summary = load_score_summary(summary_filename, sources)
+    if summary is not None:
+        progress('aggregation')
+        print(f"Loading score summary from cache: {summary_filename}")
+    else:
+        progress('forecast fetch')
+        # The forecast weather is only loaded if its rule firings are not cached
+        scored_combined_forecasted_df, _ = process_combined_forecasted_for_plotting(
+            lambda: get_combined_forecasted_data(lat, lon, timezone, city, state, models=models)[0],
+            climate_score, models=models, city=city, state=state
+        )
+        progress('scoring')
+        if resolution == 'hourly':
+            scored_historical_df, _ = process_historical_hourly_for_plotting(
+                historical_weather, climate_score, timezone, city=city, state=state
+            )
+        else:
+            scored_historical_df, _ = process_historical_for_plotting(
+                historical_weather, climate_score, city=city, state=state
+            )
+        progress('aggregation')
+        summary = score_summary(scored_historical_df, scored_combined_forecasted_df, climate_score)
+        save_cached_arrays(summary, summary_filename)
+    return {
+        'lat': lat,
+        'lon': lon,
+        'timezone': timezone,
+        'population': pop,
+        'pm25_categories_df': pm25_categories_df,
+        'summary': summary,
+    }
+
+
+def get_city_workers():
+    """Maximum number of cities processed at once (CITY_WORKERS env var, default 3)."""
+    return max(1, int(os.getenv('CITY_WORKERS', '3')))
+
+
+def fetch_and_score_cities(city_states, climate_score, models=None, max_workers=None, progress=None):
+    """
+    Run fetch_and_score_city for several cities on a bounded thread pool.
+    The work is almost entirely network and file I/O, so threads overlap well.
+    
+    Args:
+        city_states: list of (city, state) tuples
+        climate_score: Score object with preferences
+        models: list of model names for the combined forecast
+        max_workers: pool size, defaults to get_city_workers()
+        progress: optional callable, called with (city index, stage) as each city's stages start
+    
+    Returns:
+        List in the same order as city_states holding either the result
+        dictionary or the exception raised for that city
+    """
+    if not city_states:
+        return []
+    if max_workers is None:
+        max_workers = get_city_workers()
+    # Compile once up front so the workers share the rules instead of racing to build them
+    climate_score.compile()
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(city_states))) as executor:
+        futures = [
+            executor.submit(
+                fetch_and_score_city, city, state, climate_score, models,
+                (lambda stage, i=i: progress(i, stage)) if progress is not None else None
+            )
+            for i, (city, state) in enumerate(city_states)
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache that evicts the least recently used entry beyond
+    max_entries. With a ttl (seconds), entries also expire that long after being stored.
+    """
+    def __init__(self, max_entries=32, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Return the value stored for key (marking it as recently used), or None."""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            expires, value = self._entries[key]
+            if expires is not None and time.monotonic() >= expires:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries if the cache is full."""
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+def figure_cache_key(city_states, climate_score):
+    """
+    Key for the dashboard figure cache: the selected cities, every score parameter
+    and today's date (so cached figures roll over when the data is refreshed).
+    
+    Args:
+        city_states: list of included (city, state) tuples, in display order
+        climate_score: Score object with preferences
+    
+    Returns:
+        hex digest string
+    """
+    key = {
+        'cities': [[city, state] for city, state in city_states],
+        'score_params': climate_score.get_all_parameters(),
+        'date': date.today().isoformat(),
+    }
+    return hashlib.md5(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def prompt_cache_key(prompt):
+    """Key for the Gemini response cache: a hash of the exact prompt text."""
+    return hashlib.sha256(prompt.encode()).hexdigest()
+
+
+class JobCancelled(Exception):
+    """Raised inside a background job when it reports progress after being cancelled."""
+
+
+class BackgroundJob:
+    """
+    A job run by BackgroundJobs. The job function reports progress through it,
+    and cancellation takes effect at its next report.
+    """
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.state = 'queued'  # then running, and finally done, failed or cancelled
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self._cancelled = threading.Event()
+    
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+    
+    def cancel(self):
+        """Ask the job to stop; a queued job never starts."""
+        self._cancelled.set()
+    
+    def report(self, key, stage):
+        """Record that key (e.g. a city) has reached stage; raises JobCancelled once the job is cancelled."""
+        if self.cancelled:
+            raise JobCancelled(self.job_id)
+        self.progress[key] = stage
+
+
+class BackgroundJobs:
+    """
+    In-process job queue. Jobs run on a bounded thread pool so the web worker that
+    submitted one returns at once; callers poll the job for progress and its result.
+    No broker is involved, so jobs only live as long as the process.
+    """
+    def __init__(self, max_workers=2, max_jobs=64):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Finished jobs are kept (for their result) until newer ones push them out
+        self._jobs = LRUCache(max_jobs)
+    
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue func(job, *args, **kwargs).
+        
+        Returns:
+            job id string
+        """
+        job = BackgroundJob(uuid.uuid4().hex)
+        self._jobs.put(job.job_id, job)
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job.job_id
+    
+    def _run(self, job, func, args, kwargs):
+        if job.cancelled:
+            job.state = 'cancelled'
+            return
+        job.state = 'running'
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.state = 'done'
+        except JobCancelled:
+            job.state = 'cancelled'
+        except Exception as e:
+            print(f"Error in background job {job.job_id}: {e}")
+            job.error = e
+            job.state = 'failed'
+    
+    def get(self, job_id):
+        """Return the BackgroundJob for job_id, or None if it is unknown or was dropped."""
+        return self._jobs.get(job_id)
+    
+    def cancel(self, job_id):
+        """Cancel a job if it is still known."""
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+
+
+# Data types understood by get_cache_filename
+CACHE_DATA_TYPES = [
+    'historical_hourly', 'historical_daily', 'historical_pm25', 'forecasted', 'historical_score',
+    'historical_hourly_score', 'forecasted_score', 'combined_forecasted', 'combined_forecasted_score', 'score_summary'
+]
+
+try:
+    import pyarrow  # noqa: F401
+    DEFAULT_CACHE_FORMAT = 'parquet'
+except ImportError:
+    DEFAULT_CACHE_FORMAT = 'csv'
+
+# In-memory column types of the cached frames of each data type, as {column name pattern:
+# dtype}; patterns are regular expressions matched against the whole column name, since
+# forecast and score columns carry a model suffix. Weather values are float32 as the API
+# sends them, firing and outcome codes (see outcome_lookup) uint8 and calendar columns
+# int16. The hourly weather, PM2.5 and score summary caches are array stores with their
+# own types.
+_WEATHER_SCHEMA = {r'(?!datetime).+__.+': np.float32}  # <variable>__<unit>[__<model>], not datetime__<model>
+_CALENDAR_SCHEMA = {r'year|month': np.int16}
+_SCORE_SCHEMA = {r'(firing|outcome)(_.+)?': np.uint8, **_CALENDAR_SCHEMA}
+FRAME_SCHEMAS = {
+    'historical_daily': _WEATHER_SCHEMA,
+    'forecasted': _WEATHER_SCHEMA,
+    'combined_forecasted': {**_WEATHER_SCHEMA, **_CALENDAR_SCHEMA},
+    'historical_score': {**_SCORE_SCHEMA, 'weather_complete': bool},
+    'historical_hourly_score': {**_SCORE_SCHEMA, 'weather_complete': bool},
+    'forecasted_score': _SCORE_SCHEMA,
+    'combined_forecasted_score': _SCORE_SCHEMA,
+}
+
+
+def apply_frame_schema(df, data_type):
+    """
+    Cast the columns of a frame to the FRAME_SCHEMAS types of its data type.
+    Columns that already have their type, or match no pattern, are left as they are.
+    
+    Args:
+        df: DataFrame fetched, computed or loaded for data_type
+        data_type: key of FRAME_SCHEMAS
+    
+    Returns:
+        DataFrame with the schema types
+    """
+    dtypes = {}
+    for col in df.columns:
+        for pattern, dtype in FRAME_SCHEMAS[data_type].items():
+            if re.fullmatch(pattern, col):
+                if df[col].dtype != dtype:
+                    dtypes[col] = dtype
+                break
+    return df.astype(dtypes) if dtypes else df
+
+
+def _read_csv_cache(filename):
+    df = pd.read_csv(filename)
+    # Convert date columns back to datetime
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+# Cache file backends. Parquet and Feather store typed columns (timezone-aware datetimes,
+# categoricals, float32), so loading skips text parsing; CSV is the fallback without pyarrow.
+CACHE_FORMATS = {
+    'parquet': {
+        'extension': '.parquet',
+        'read': pd.read_parquet,
+        'write': lambda df, filename: df.to_parquet(filename, index=False),
+    },
+    'feather': {
+        'extension': '.feather',
+        'read': pd.read_feather,
+        'write': lambda df, filename: df.reset_index(drop=True).to_feather(filename),
+    },
+    'csv': {
+        'extension': '.csv',
+        'read': _read_csv_cache,
+        'write': lambda df, filename: df.to_csv(filename, index=False),
+    },
+}
+
+
+def get_cache_format():
+    """
+    Get the cache file format, set with the CACHE_FORMAT environment variable.
+    
+    Returns:
+        Key of CACHE_FORMATS ('parquet' by default when pyarrow is installed, otherwise 'csv')
+    """
+    cache_format = os.getenv('CACHE_FORMAT', DEFAULT_CACHE_FORMAT).lower()
+    if cache_format not in CACHE_FORMATS:
+        raise ValueError(f"CACHE_FORMAT must be one of {list(CACHE_FORMATS)}, got {cache_format}")
+    return cache_format
+
+
+def _cache_format_of(filename):
+    """Return the CACHE_FORMATS entry matching a cache file's extension."""
+    extension = os.path.splitext(filename)[1]
+    for backend in CACHE_FORMATS.values():
+        if backend['extension'] == extension:
+            return backend
+    raise ValueError(f"Unknown cache file extension: {filename}")
+
+
+def read_cache_file(filename):
+    """
+    Read a cache file with the backend matching its extension.
+    
+    Args:
+        filename: cache filename
+    
+    Returns:
+        DataFrame, with any 'date' column as datetime
+    """
+    df = _cache_format_of(filename)['read'](filename)
+    if 'date' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['date']):
+        df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def _atomic_write(filename, write):
+    """
+    Write a file via a temporary file in the same directory that is then renamed over it,
+    so concurrent readers see either the old or the complete new file, never a partial one.
+    
+    Args:
+        filename: target filename
+        write: function writing the content to the path it is given
+    """
+    tmp_filename = f"{filename}.{uuid.uuid4().hex}.tmp"
+    try:
+        write(tmp_filename)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+def write_cache_file(df, filename):
+    """
+    Write a dataframe (atomically) with the backend matching the file's extension.
+    
+    Args:
+        df: DataFrame to save
+        filename: cache filename
+    """
+    backend = _cache_format_of(filename)
+    _atomic_write(filename, lambda tmp_filename: backend['write'](df, tmp_filename))
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the function
+    and any caller arriving while it runs waits for and gets the same result (or
+    exception). Shared results must be treated as read-only.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key, func, *args, **kwargs):
+        """Return func(*args, **kwargs), joining the call already in flight for key if there is one."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result()
+        try:
+            result = func(*args, **kwargs)
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+# In-flight cache fills, keyed by cache filename
+_cache_flights = SingleFlight()
+
+
+def get_cache_filename(data_type, city, state, model=None, score_params=None, models=None, cache_format=None):
+    """
+    Generate cache filename based on data type and parameters.
+    
+    Args:
+        data_type: one of CACHE_DATA_TYPES
+        city: city name
+        state: state name
+        model: model name (for forecasted data)
+        score_params: score parameters dict (for score data; the *_score files hold rule
+            firings and are keyed by Score.get_threshold_parameters())
+        models: list of model names (for combined forecasted data)
+        cache_format: key of CACHE_FORMATS, defaults to get_cache_format()
+    
+    Returns:
+        cache filename string
+    """
+    # Create cache directory if it doesn't exist
+    cache_dir = "cache"
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    extension = CACHE_FORMATS[cache_format or get_cache_format()]['extension']
+    
+    if data_type == "historical_hourly":
+        # Hourly weather is kept as a compact array store (see update_historical_hourly_store)
+        return os.path.join(cache_dir, f"{city}_{state}_historical_hourly{HOURLY_STORE_EXTENSION}")
+    elif data_type == "historical_daily":
+        return os.path.join(cache_dir, f"{city}_{state}_historical_daily{extension}")
+    elif data_type == "historical_pm25":
+        # Hourly PM2.5 is kept in its own compact store (see build_pm25_store)
+        return os.path.join(cache_dir, f"{city}_{state}_historical_pm25{PM25_STORE_EXTENSION}")
+    elif data_type == "forecasted":
+        return os.path.join(cache_dir, f"{city}_{state}_{model}_forecasted_data{extension}")
+    elif data_type == "historical_score":
+        # Create hash of score parameters for filename
+        score_hash = hashlib.md5(json.dumps(score_params, sort_keys=True).encode()).hexdigest()[:8]
+        return os.path.join(cache_dir, f"{city}_{state}_historical_score_{score_hash}{extension}")
+    elif data_type == "historical_hourly_score":
+        # Create hash of score parameters for filename
+        score_hash = hashlib.md5(json.dumps(score_params, sort_keys=True).encode()).hexdigest()[:8]
+        return os.path.join(cache_dir, f"{city}_{state}_historical_hourly_score_{score_hash}{extension}")
+    elif data_type == "forecasted_score":
+        # Create hash of score parameters for filename
+        score_hash = hashlib.md5(json.dumps(score_params, sort_keys=True).encode()).hexdigest()[:8]
+        return os.path.join(cache_dir, f"{city}_{state}_{model}_forecasted_score_{score_hash}{extension}")
+    elif data_type == "combined_forecasted":
+        models_str = '_'.join(models) if models else 'all_models'
+        return os.path.join(cache_dir, f"{city}_{state}_{models_str}_combined_forecasted_data{extension}")
+    elif data_type == "score_summary":
+        # Small array file with every aggregate the score charts plot (see score_summary)
+        score_hash = hashlib.md5(json.dumps(score_params, sort_keys=True).encode()).hexdigest()[:8]
+        models_str = '_'.join(models) if models else 'all_models'
+        return os.path.join(cache_dir, f"{city}_{state}_{models_str}_score_summary_{score_hash}.npz")
+    elif data_type == "combined_forecasted_score":
+        # Create hash of score parameters for filename
+        score_hash = hashlib.md5(json.dumps(score_params, sort_keys=True).encode()).hexdigest()[:8]
+        models_str = '_'.join(models) if models else 'all_models'
+        return os.path.join(cache_dir, f"{city}_{state}_{models_str}_combined_forecasted_score_{score_hash}{extension}")
+    else:
+        raise ValueError(f"Unknown data_type: {data_type}")
+
+
+def get_cache_directory_file():
+    """
+    Get the path to the cache directory database.
+    
+    Returns:
+        Path to the SQLite file holding the cache metadata
+    """
+    cache_dir = "cache"
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    return os.path.join(cache_dir, "cache_directory.sqlite3")
+
+
+# One connection per thread (and per process, in case of a fork)
+_cache_db_local = threading.local()
+
+
+def get_cache_db():
+    """
+    Get this thread's connection to the cache directory database, creating the
+    schema on first use. The database runs in WAL mode so concurrent workers can
+    read while one of them writes, and statements are committed as they run.
+    
+    Returns:
+        sqlite3.Connection
+    """
+    conn = getattr(_cache_db_local, 'conn', None)
+    if conn is not None and _cache_db_local.pid == os.getpid():
+        return conn
+    
+    conn = sqlite3.connect(get_cache_directory_file(), timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS cache_files (
+            filename TEXT PRIMARY KEY,
+            size_bytes INTEGER NOT NULL DEFAULT 0,
+            access_count INTEGER NOT NULL DEFAULT 0,
+            last_accessed REAL NOT NULL
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_files_last_accessed ON cache_files (last_accessed)")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS geocode (
+            city_key TEXT NOT NULL,
+            state_key TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            timezone TEXT NOT NULL,
+            population INTEGER,
+            PRIMARY KEY (city_key, state_key)
+        )"""
+    )
+    _cache_db_local.conn = conn
+    _cache_db_local.pid = os.getpid()
+    _import_legacy_cache_directory(conn)
+    return conn
+
+
+def _import_legacy_cache_directory(conn):
+    """Move entries from the old cache_directory.json into the database, then remove the JSON file."""
+    legacy_file = os.path.join(os.path.dirname(get_cache_directory_file()), "cache_directory.json")
+    if not os.path.exists(legacy_file):
+        return
+    try:
+        with open(legacy_file, 'r') as f:
+            cache_info = json.load(f)
+        conn.executemany(
+            "INSERT OR IGNORE INTO cache_files (filename, size_bytes, access_count, last_accessed) VALUES (?, ?, ?, ?)",
+            [
+                (filename, info.get('size_bytes', 0), info.get('access_count', 0), info.get('last_accessed', 0))
+                for filename, info in cache_info.items()
+            ]
+        )
+        os.remove(legacy_file)
+    except Exception as e:
+        print(f"Error importing legacy cache directory: {e}")
+
+
+def load_cache_directory():
+    """
+    Load the cache directory information.
+    
+    Returns:
+        Dictionary containing cache file information
+    """
+    rows = get_cache_db().execute("SELECT filename, size_bytes, access_count, last_accessed FROM cache_files")
+    return {
+        filename: {'last_accessed': last_accessed, 'size_bytes': size_bytes, 'access_count': access_count}
+        for filename, size_bytes, access_count, last_accessed in rows
+    }
+
+
+def update_cache_access_info(filename, size_bytes=None):
+    """
+    Update the access information for a cache file.
+    Increments access count and updates last access time in a single atomic statement.
+    
+    Args:
+        filename: Path to the cache file
+        size_bytes: New file size to record, e.g. after the file was (re)written
+    """
+    if size_bytes is None:
+        get_cache_db().execute(
+            """INSERT INTO cache_files (filename, size_bytes, access_count, last_accessed) VALUES (?, ?, 1, ?)
+            ON CONFLICT (filename) DO UPDATE SET
+                access_count = access_count + 1,
+                last_accessed = excluded.last_accessed""",
+            (filename, get_cache_file_size(filename), time.time())
+        )
+    else:
+        get_cache_db().execute(
+            """INSERT INTO cache_files (filename, size_bytes, access_count, last_accessed) VALUES (?, ?, 1, ?)
+            ON CONFLICT (filename) DO UPDATE SET
+                access_count = access_count + 1,
+                last_accessed = excluded.last_accessed,
+                size_bytes = excluded.size_bytes""",
+            (filename, size_bytes, time.time())
+        )
+
+
+def rename_cache_entry(old_filename, new_filename):
+    """
+    Move the access history of a cache file to a new filename (e.g. after a format migration).
+    
+    Args:
+        old_filename: previous path of the cache file
+        new_filename: new path of the cache file
+    """
+    conn = get_cache_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM cache_files WHERE filename = ?", (new_filename,))
+        conn.execute(
+            "INSERT OR IGNORE INTO cache_files (filename, size_bytes, access_count, last_accessed) VALUES (?, 0, 0, ?)",
+            (old_filename, time.time())
+        )
+        conn.execute(
+            "UPDATE cache_files SET filename = ?, size_bytes = ? WHERE filename = ?",
+            (new_filename, get_cache_file_size(new_filename), old_filename)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def get_cache_file_size(filename):
+    """
+    Get the size of a cache file in bytes.
+    
+    Args:
         filename: Path to the cache file
     
     Returns:
@@ -815,72 +2889,77 @@ def get_cache_file_size(filename):
 def cleanup_cache_if_needed(max_size_mb=100):
     """
     Clean up cache files if total size exceeds 100 MB.
-    Keeps the most recently accessed files that fit within 100 MB.
+    Keeps the most recently accessed files that fit within 100 MB; everything
+    accessed less recently than the file that crosses the limit is deleted.
     """
-    cache_info = load_cache_directory()
-    
-    # Calculate total cache size
-    total_size = sum(info.get('size_bytes', 0) for info in cache_info.values())
+    conn = get_cache_db()
     max_cache_size = max_size_mb * 1024 * 1024  # 100 MB in bytes
+    total_size = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM cache_files").fetchone()[0]
     
     if total_size <= max_cache_size:
         return
     
     print(f"Cache size ({total_size / (1024*1024):.1f} MB) exceeds limit (100 MB). Cleaning up...")
     
-    # Sort files by last access time (most recent first)
-    sorted_files = sorted(
-        cache_info.items(),
-        key=lambda x: x[1].get('last_accessed', 0),
-        reverse=True
-    )
-    
-    # Keep files until we're under the limit
-    files_to_keep = []
-    current_size = 0
-    
-    for filename, info in sorted_files:
-        file_size = info.get('size_bytes', 0)
-        if current_size + file_size <= max_cache_size:
-            files_to_keep.append(filename)
-            current_size += file_size
-        else:
-            # Delete this file
-            try:
-                if os.path.exists(filename):
-                    os.remove(filename)
-                    print(f"Deleted cache file: {filename}")
-            except OSError as e:
-                print(f"Error deleting cache file {filename}: {e}")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Running total from the most recently accessed file down, walking the last_accessed index
+        evicted = conn.execute(
+            """SELECT filename, size_bytes FROM (
+                SELECT filename, size_bytes,
+                    SUM(size_bytes) OVER (ORDER BY last_accessed DESC ROWS UNBOUNDED PRECEDING) AS running_size
+                FROM cache_files
+            ) WHERE running_size > ?""",
+            (max_cache_size,)
+        ).fetchall()
+        conn.executemany("DELETE FROM cache_files WHERE filename = ?", [(filename,) for filename, _ in evicted])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
     
-    # Update cache directory with only kept files
-    new_cache_info = {filename: cache_info[filename] for filename in files_to_keep}
-    save_cache_directory(new_cache_info)
+    for filename, _ in evicted:
+        try:
+            if os.path.exists(filename):
+                os.remove(filename)
+                print(f"Deleted cache file: {filename}")
+        except OSError as e:
+            print(f"Error deleting cache file {filename}: {e}")
     
+    current_size = total_size - sum(size for _, size in evicted)
     print(f"Cache cleanup complete. New size: {current_size / (1024*1024):.1f} MB")
 
 
-def load_cached_data(filename):
+def load_cached_data(filename, data_type=None):
     """
     Load data from cache file if it exists.
-    Updates the access information for the file.
+    Updates the access information for the file. A legacy CSV file with the
+    same name is migrated to the file's format on first use.
     
     Args:
         filename: cache filename
+        data_type: key of FRAME_SCHEMAS the frame is cast to (files written before
+            the schema, and CSV files, come back as float64/int64/object columns)
     
     Returns:
         DataFrame if file exists, None otherwise
     """
+    if not os.path.exists(filename):
+        # Pick up files written by the old CSV-only cache
+        legacy_filename = os.path.splitext(filename)[0] + '.csv'
+        if legacy_filename != filename and os.path.exists(legacy_filename):
+            try:
+                migrate_cache_file(legacy_filename, filename)
+            except Exception as e:
+                print(f"Error migrating cached data from {legacy_filename}: {e}")
+                return None
     if os.path.exists(filename):
         try:
             # Update access information (increments access count)
             update_cache_access_info(filename)
             
-            df = pd.read_csv(filename)
-            # Convert date columns back to datetime
-            if 'date' in df.columns:
-                df['date'] = pd.to_datetime(df['date'])
-            return df
+            df = read_cache_file(filename)
+            return apply_frame_schema(df, data_type) if data_type else df
         except Exception as e:
             print(f"Error loading cached data from {filename}: {e}")
             return None
@@ -897,17 +2976,11 @@ def save_cached_data(df, filename):
         filename: cache filename
     """
     try:
-        df.to_csv(filename, index=False)
+        write_cache_file(df, filename)
         
-        # Update cache directory with file info
+        # Update cache directory with file info (access_count starts at 1 for new files)
         file_size = get_cache_file_size(filename)
-        update_cache_access_info(filename)  # This will set access_count to 1 for new files
-        
-        # Update the size in cache directory
-        cache_info = load_cache_directory()
-        if filename in cache_info:
-            cache_info[filename]['size_bytes'] = file_size
-            save_cache_directory(cache_info)
+        update_cache_access_info(filename, size_bytes=file_size)
         
         print(f"Data cached to {filename} ({file_size / (1024*1024):.1f} MB)")
         
@@ -917,6 +2990,104 @@ def save_cached_data(df, filename):
     except Exception as e:
         print(f"Error saving cached data to {filename}: {e}")
 
+def read_array_file(filename, skip=()):
+    """
+    Read the arrays of an .npz cache file into a dictionary.
+    
+    Args:
+        filename: .npz file
+        skip: names of arrays not to read (arrays in an .npz file are only read when accessed)
+    """
+    with np.load(filename) as data:
+        return {name: data[name] for name in data.files if name not in skip}
+
+
+def write_array_file(arrays, filename):
+    """Write a dictionary of arrays to an uncompressed .npz file (atomically)."""
+    def write(tmp_filename):
+        with open(tmp_filename, 'wb') as f:
+            np.savez(f, **arrays)
+    _atomic_write(filename, write)
+
+
+def load_cached_arrays(filename, skip=()):
+    """
+    Load an .npz cache file if it exists, updating its access information.
+    
+    Returns:
+        Dictionary of arrays if the file exists, None otherwise
+    """
+    if not os.path.exists(filename):
+        return None
+    try:
+        update_cache_access_info(filename)
+        return read_array_file(filename, skip)
+    except Exception as e:
+        print(f"Error loading cached data from {filename}: {e}")
+        return None
+
+
+def save_cached_arrays(arrays, filename):
+    """
+    Save a dictionary of arrays to an .npz cache file.
+    Updates the cache directory and performs cleanup if needed.
+    """
+    try:
+        write_array_file(arrays, filename)
+        file_size = get_cache_file_size(filename)
+        update_cache_access_info(filename, size_bytes=file_size)
+        print(f"Data cached to {filename} ({file_size / (1024*1024):.1f} MB)")
+        cleanup_cache_if_needed()
+    except Exception as e:
+        print(f"Error saving cached data to {filename}: {e}")
+
+
+def migrate_cache_file(old_filename, new_filename):
+    """
+    Rewrite a cache file in another format, carrying over its access history.
+    
+    Args:
+        old_filename: existing cache file (e.g. a legacy .csv file)
+        new_filename: target filename; its extension picks the new format
+    
+    Returns:
+        The migrated DataFrame
+    """
+    df = read_cache_file(old_filename)
+    if 'datetime' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['datetime']):
+        # CSV stores timestamps as text with their UTC offset
+        df['datetime'] = pd.to_datetime(df['datetime'], utc=True)
+    write_cache_file(df, new_filename)
+    os.remove(old_filename)
+    rename_cache_entry(old_filename, new_filename)
+    print(f"Migrated cache file {old_filename} -> {new_filename}")
+    return df
+
+
+def migrate_csv_cache(cache_format=None):
+    """
+    Convert every legacy cache/*.csv file to the given format.
+    
+    Args:
+        cache_format: key of CACHE_FORMATS, defaults to get_cache_format()
+    
+    Returns:
+        List of migrated filenames
+    """
+    extension = CACHE_FORMATS[cache_format or get_cache_format()]['extension']
+    if extension == '.csv':
+        return []
+    migrated = []
+    for old_filename in sorted(Path("cache").glob("*.csv")):
+        new_filename = str(old_filename.with_suffix(extension))
+        try:
+            migrate_cache_file(str(old_filename), new_filename)
+            migrated.append(new_filename)
+        except Exception as e:
+            print(f"Error migrating cache file {old_filename}: {e}")
+    return migrated
+
+
 def build_gemini_prompt(score: Score, additional_preferences=None, disaster_preferences=None):
     params = score.get_all_parameters()
     prompt = (
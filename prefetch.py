@@ -0,0 +1,135 @@
+"""
+Warm the cache for a list of cities, so their first users skip the cold path.
+
+Usage:
+    python prefetch.py CITIES_CSV [--workers N] [--rate R] [--score-default]
+                                  [--checkpoint FILE] [--restart]
+
+CITIES_CSV needs `city` and `state` columns (other columns are ignored, so a
+GEOCODE_BOOTSTRAP_FILE works as is). Spell the names the way users enter them
+in the app, since cache files are named after them. For each city the geocode,
+historical weather (at HISTORICAL_RESOLUTION), PM2.5 and combined forecast
+caches are filled; with --score-default the scores and score summary of the
+default preferences too.
+
+API requests are kept under --rate per second across all workers. Each
+finished city is appended to the checkpoint file, and a rerun skips the cities
+that already succeeded (--restart starts over).
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from helper import (
+    Score, fetch_and_score_city, get_city_info, get_city_workers, get_combined_forecasted_data,
+    get_historical_and_aqi_data, get_historical_resolution, get_http_stats, set_api_rate_limit
+)
+
+
+def read_cities(filename):
+    """Read the distinct (city, state) pairs of a CSV file, in file order."""
+    with open(filename, newline="") as f:
+        rows = [(row["city"].strip(), row["state"].strip()) for row in csv.DictReader(f)]
+    return list(dict.fromkeys(row for row in rows if all(row)))
+
+
+def read_checkpoint(filename):
+    """Return the (city, state) pairs a checkpoint file records as done."""
+    done = set()
+    if not os.path.exists(filename):
+        return done
+    with open(filename) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run
+                continue
+            if entry["status"] == "ok":
+                done.add((entry["city"], entry["state"]))
+    return done
+
+
+def prefetch_city(city, state, climate_score=None):
+    """Fill the caches for one city; given a Score, also its scores and score summary."""
+    if climate_score is not None:
+        fetch_and_score_city(city, state, climate_score)
+        return
+    lat, lon, timezone, _ = get_city_info(city, state)
+    get_historical_and_aqi_data(lat, lon, timezone, city, state, resolution=get_historical_resolution())
+    get_combined_forecasted_data(lat, lon, timezone, city, state)
+
+
+def prefetch(cities, workers, checkpoint, climate_score=None):
+    """Prefetch cities in parallel, recording each in the checkpoint file and reporting throughput."""
+    if climate_score is not None:
+        # Compile once up front so the workers share the rules instead of racing to build them
+        climate_score.compile()
+    checkpoint_lock = threading.Lock()
+
+    def run(city, state):
+        city_start = time.perf_counter()
+        try:
+            prefetch_city(city, state, climate_score)
+            entry = {"city": city, "state": state, "status": "ok"}
+        except Exception as e:
+            entry = {"city": city, "state": state, "status": "error", "error": str(e)}
+        entry["seconds"] = round(time.perf_counter() - city_start, 2)
+        with checkpoint_lock, open(checkpoint, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        return entry
+
+    start = time.perf_counter()
+    requests_before = get_http_stats()["requests"]
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, city, state) for city, state in cities]
+        for n_done, future in enumerate(as_completed(futures), 1):
+            entry = future.result()
+            failed += entry["status"] != "ok"
+            elapsed = time.perf_counter() - start
+            api_requests = get_http_stats()["requests"] - requests_before
+            outcome = "ok" if entry["status"] == "ok" else f"error - {entry['error']}"
+            print(f"[{n_done}/{len(cities)}] {entry['city']}, {entry['state']}: {outcome} ({entry['seconds']:.1f}s) | "
+                  f"{n_done / elapsed * 60:.1f} cities/min, {api_requests / elapsed:.2f} API requests/s")
+
+    elapsed = time.perf_counter() - start
+    stats = get_http_stats()
+    api_requests = stats["requests"] - requests_before
+    print("-" * 60)
+    print(f"Prefetched {len(cities) - failed} of {len(cities)} cities in {elapsed:.1f}s "
+          f"({len(cities) / elapsed * 60 if elapsed else 0:.1f} cities/min), {failed} failed")
+    print(f"API requests: {api_requests} ({api_requests / elapsed if elapsed else 0:.2f}/s), "
+          f"reused connections: {stats['reused_connections']}, retries: {stats['retries']}")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cities_csv", help="CSV file with city and state columns")
+    parser.add_argument("--workers", type=int, default=None, help="cities processed at once (default: CITY_WORKERS)")
+    parser.add_argument("--rate", type=float, default=5, help="maximum API requests per second, 0 for no limit")
+    parser.add_argument("--score-default", action="store_true", help="also score the default preferences")
+    parser.add_argument("--checkpoint", default="prefetch_checkpoint.jsonl", help="progress file used to resume")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and prefetch every city")
+    args = parser.parse_args()
+
+    # Same settings (cache format, HTTP tuning, geocode bootstrap) as the app
+    load_dotenv()
+    cities = read_cities(args.cities_csv)
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    done = read_checkpoint(args.checkpoint)
+    todo = [city_state for city_state in cities if city_state not in done]
+    print(f"{len(cities)} cities, {len(cities) - len(todo)} already done, {len(todo)} to prefetch")
+
+    set_api_rate_limit(args.rate)
+    failed = prefetch(todo, args.workers or get_city_workers(), args.checkpoint,
+                      Score() if args.score_default else None)
+    raise SystemExit(1 if failed else 0)